@@ -0,0 +1,375 @@
+"""Замеры производительности горячих путей homework.py.
+
+Пример запуска:
+    python benchmark.py --count 10000 --mix SWM=1,RUN=2,WLK=1 \
+        --output bench.json --baseline baseline.json
+Длительный прогон синтетическим трафиком (отчеты в JSON по строке):
+    python benchmark.py --soak 600 --rate 5000 --duplicates 0.2 \
+        --malformed 0.03 --interval 10 --processor cache
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from array import array
+from dataclasses import fields
+from typing import Callable, Iterator
+
+import homework
+
+# Диапазоны параметров синтетических пакетов
+ACTION_RANGE = (100, 30000)
+DURATION_RANGE = (0.25, 3.0)
+WEIGHT_RANGE = (45.0, 120.0)
+HEIGHT_RANGE = (150.0, 200.0)
+LENGTH_POOL_RANGE = (25, 50)
+COUNT_POOL_RANGE = (1, 80)
+DEFAULT_MIX = {'SWM': 1, 'RUN': 1, 'WLK': 1}
+# Генераторы значений по именам полей классов тренировок; для
+# неизвестных полей используется DEFAULT_FIELD_RANGE
+FIELD_SAMPLERS = {
+    'action': lambda rng: rng.randint(*ACTION_RANGE),
+    'duration': lambda rng: round(rng.uniform(*DURATION_RANGE), 2),
+    'weight': lambda rng: round(rng.uniform(*WEIGHT_RANGE), 1),
+    'height': lambda rng: round(rng.uniform(*HEIGHT_RANGE), 1),
+    'length_pool': lambda rng: rng.choice(LENGTH_POOL_RANGE),
+    'count_pool': lambda rng: rng.randint(*COUNT_POOL_RANGE),
+}
+DEFAULT_FIELD_RANGE = (1.0, 100.0)
+# Число последних пакетов, из которых берутся дубликаты
+DUPLICATE_WINDOW = 1000
+# Число замеров задержки, сохраняемых за интервал прогона под нагрузкой
+LATENCY_SAMPLE_SIZE = 10000
+# Допустимый рост времени на пакет относительно эталона
+DEFAULT_THRESHOLD = 0.10
+
+
+def sample_default(rng: random.Random) -> float:
+    """Значение поля, для которого нет генератора в FIELD_SAMPLERS."""
+    return round(rng.uniform(*DEFAULT_FIELD_RANGE), 2)
+
+
+def make_package(workout_type: str, rng: random.Random) -> tuple:
+    """Создать один синтетический пакет тренировки.
+    Параметры соответствуют полям класса из TRAINING_CODES.
+    """
+    workout_class = homework.TRAINING_CODES[workout_type][0]
+    return workout_type, [
+        FIELD_SAMPLERS.get(field.name, sample_default)(rng)
+        for field in fields(workout_class)
+    ]
+
+
+def make_malformed_package(workout_type: str, rng: random.Random) -> tuple:
+    """Создать испорченный пакет: неизвестный код, неверное число
+    параметров или нечисловой параметр.
+    """
+    workout_type, data = make_package(workout_type, rng)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return 'XXX', data
+    if kind == 1:
+        return workout_type, data[:-1]
+    data[rng.randrange(len(data))] = 'n/a'
+    return workout_type, data
+
+
+def generate_traffic(mix: dict = None, duplicate_ratio: float = 0.0,
+                     malformed_ratio: float = 0.0, rate: float = None,
+                     seed: int = 0) -> Iterator[tuple]:
+    """Бесконечный поток синтетических пакетов.
+    mix задает вес кодов тренировок, duplicate_ratio - долю повторов
+    недавних пакетов, malformed_ratio - долю испорченных пакетов,
+    rate - целевое число пакетов в секунду (None - без ограничения).
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    codes = list(mix)
+    weights = list(mix.values())
+    recent = []
+    started = time.perf_counter()
+    produced = 0
+    while True:
+        if rate:
+            delay = started + produced / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        workout_type = rng.choices(codes, weights)[0]
+        chance = rng.random()
+        if chance < malformed_ratio:
+            package = make_malformed_package(workout_type, rng)
+        elif recent and chance < malformed_ratio + duplicate_ratio:
+            package = rng.choice(recent)
+        else:
+            package = make_package(workout_type, rng)
+            recent.append(package)
+            if len(recent) > DUPLICATE_WINDOW:
+                recent.pop(0)
+        produced += 1
+        yield package
+
+
+def generate_packages(count: int, mix: dict = None, seed: int = 0) -> list:
+    """Создать count пакетов с заданным весом кодов тренировок."""
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    codes = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [make_package(code, rng) for code in codes]
+
+
+def parse_mix(value: str) -> dict:
+    """Разобрать строку вида 'SWM=1,RUN=2,WLK=1'."""
+    mix = {}
+    for item in value.split(','):
+        code, weight = item.split('=')
+        if code not in homework.TRAINING_CODES:
+            raise argparse.ArgumentTypeError(
+                homework.ERR_TRAINING_TYPE_TEMPLATE.format(training_code=code)
+            )
+        mix[code] = float(weight)
+    return mix
+
+
+def measure(function: Callable, items: list, repeat: int) -> float:
+    """Вернуть лучшее из repeat время вызова function на элемент, нс."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            function(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items) * 1e9
+
+
+def run_benchmarks(count: int = 10000, mix: dict = None, repeat: int = 5,
+                   seed: int = 0) -> dict:
+    """Прогнать замеры горячих путей и вернуть нс на пакет по каждому."""
+    packages = generate_packages(count, mix, seed)
+    trainings = [homework.read_package(*package) for package in packages]
+    messages = [training.show_training_info() for training in trainings]
+    results = {
+        'read_package': measure(
+            lambda package: homework.read_package(*package),
+            packages, repeat
+        ),
+        'is_correct_package': measure(
+            lambda package: homework.is_correct_package(*package),
+            packages, repeat
+        ),
+        'show_training_info': measure(
+            lambda training: training.show_training_info(),
+            trainings, repeat
+        ),
+        'get_message': measure(
+            lambda info: info.get_message(), messages, repeat
+        ),
+    }
+    for workout_type, (workout_class, _) in homework.TRAINING_CODES.items():
+        selected = [
+            training for training in trainings
+            if type(training) is workout_class
+        ]
+        if selected:
+            results[f'{workout_class.__name__}.get_spent_calories'] = measure(
+                lambda training: training.get_spent_calories(),
+                selected, repeat
+            )
+    return results
+
+
+def make_report(results: dict, count: int, mix: dict, repeat: int,
+                seed: int) -> dict:
+    """Собрать отчет замеров с параметрами запуска."""
+    return {
+        'unit': 'ns/op',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'count': count,
+        'mix': mix,
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare(results: dict, baseline: dict,
+            threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """Вернуть замеры, ставшие медленнее эталона больше чем на threshold.
+    Значение - относительное изменение времени на пакет.
+    """
+    regressions = {}
+    for name, value in results.items():
+        reference = baseline.get(name)
+        if reference:
+            change = value / reference - 1
+            if change > threshold:
+                regressions[name] = change
+    return regressions
+
+
+def get_rss() -> int:
+    """Вернуть текущий размер резидентной памяти процесса в байтах
+    (пиковый, если /proc недоступен).
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def make_processor(name: str) -> Callable:
+    """Вернуть функцию обработки пакета для прогона под нагрузкой."""
+    if name == 'cache':
+        cache = homework.PackageCache()
+
+        def process(package: tuple) -> str:
+            try:
+                return cache.get_message(*package)
+            except homework.PACKAGE_ERRORS as error:
+                return str(error)
+
+        return process
+    return homework.format_package
+
+
+class LatencySample:
+    """Равномерная выборка фиксированного размера из замеров задержки за
+    интервал (reservoir sampling). Память выделяется один раз, поэтому
+    прирост RSS во время прогона не зависит от числа пакетов.
+    """
+
+    def __init__(self, size: int = LATENCY_SAMPLE_SIZE,
+                 seed: int = 0) -> None:
+        self.values = array('d', bytes(8 * size))
+        self.size = size
+        self.count = 0
+        self.rng = random.Random(seed)
+
+    def add(self, value: float) -> None:
+        """Учесть один замер."""
+        count = self.count
+        self.count += 1
+        if count < self.size:
+            self.values[count] = value
+            return
+        index = self.rng.randrange(self.count)
+        if index < self.size:
+            self.values[index] = value
+
+    def percentile(self, fraction: float) -> float:
+        """Вернуть перцентиль выборки."""
+        return homework.percentile(
+            self.values[:min(self.count, self.size)], fraction
+        )
+
+    def clear(self) -> None:
+        """Начать новый интервал."""
+        self.count = 0
+
+
+def soak(duration: float, rate: float = None, mix: dict = None,
+         duplicate_ratio: float = 0.0, malformed_ratio: float = 0.0,
+         interval: float = 10.0, processor: str = 'plain',
+         seed: int = 0, report: Callable = None) -> list:
+    """Обрабатывать синтетический трафик duration секунд и каждые
+    interval секунд формировать отчет: пропускная способность,
+    перцентили задержки, доля ошибок и прирост памяти с начала прогона.
+    Перцентили считаются по выборке из LATENCY_SAMPLE_SIZE замеров.
+    Отчеты передаются в report и возвращаются списком.
+    """
+    process = make_processor(processor)
+    traffic = generate_traffic(mix, duplicate_ratio, malformed_ratio,
+                               rate, seed)
+    clock = time.perf_counter
+    started = clock()
+    rss_start = get_rss()
+    reports = []
+    window_start = started
+    latencies = LatencySample(seed=seed)
+    errors = 0
+    total = 0
+    for package in traffic:
+        start = clock()
+        line = process(package)
+        finished = clock()
+        latencies.add(finished - start)
+        errors += not line.startswith('Тип тренировки')
+        done = finished - started >= duration
+        if done or finished - window_start >= interval:
+            total += latencies.count
+            rss = get_rss()
+            reports.append({
+                'elapsed': finished - started,
+                'packages': total,
+                'throughput': latencies.count / (finished - window_start),
+                'p50': latencies.percentile(0.5),
+                'p99': latencies.percentile(0.99),
+                'error_rate': errors / latencies.count,
+                'rss': rss,
+                'rss_growth': rss - rss_start,
+            })
+            if report is not None:
+                report(reports[-1])
+            window_start = finished
+            latencies.clear()
+            errors = 0
+            if done:
+                break
+    return reports
+
+
+def main(argv: list = None) -> int:
+    """Запуск замеров из командной строки.
+    Возвращает 1, если найдено замедление относительно эталона.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='файл для отчета в JSON')
+    parser.add_argument('--baseline', help='отчет JSON для сравнения')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--soak', type=float, metavar='SECONDS',
+                        help='длительный прогон синтетическим трафиком')
+    parser.add_argument('--rate', type=float, help='пакетов в секунду')
+    parser.add_argument('--duplicates', type=float, default=0.0)
+    parser.add_argument('--malformed', type=float, default=0.0)
+    parser.add_argument('--interval', type=float, default=10.0)
+    parser.add_argument('--processor', choices=['plain', 'cache'],
+                        default='plain')
+    args = parser.parse_args(argv)
+
+    if args.soak:
+        soak(args.soak, args.rate, args.mix, args.duplicates, args.malformed,
+             args.interval, args.processor, args.seed,
+             report=lambda item: print(json.dumps(item), flush=True))
+        return 0
+
+    results = run_benchmarks(args.count, args.mix, args.repeat, args.seed)
+    report = make_report(results, args.count, args.mix, args.repeat,
+                         args.seed)
+    for name, value in results.items():
+        print(f'{name:<40} {value:10.1f} ns/op')
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)['results']
+    regressions = compare(results, baseline, args.threshold)
+    for name, change in regressions.items():
+        print(f'REGRESSION {name}: +{change:.1%}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,24 @@
 """Александр Лощилов, Когорта 10+, бэкенд-факультет Python, Rev 4.0"""
-from dataclasses import dataclass, fields, asdict
+# Тяжелые модули (asyncio, concurrent.futures, json, mmap, queue,
+# threading, numpy) импортируются внутри функций, которым они нужны:
+# короткие запуски из cron не должны платить за их загрузку.
+from __future__ import annotations
+
+import bisect
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from operator import attrgetter
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, TextIO
+
+if TYPE_CHECKING:
+    import asyncio
+    import queue
 
 
 @dataclass
@@ -21,7 +40,13 @@ class InfoMessage:
 
     def get_message(self) -> str:
         """Возвращает сообщение, содержащее детали тренировки."""
-        return self.TEMPLATE.format(**asdict(self))
+        return self.TEMPLATE.format(
+            training_type=self.training_type,
+            duration=self.duration,
+            distance=self.distance,
+            speed=self.speed,
+            calories=self.calories
+        )
 
 
 @dataclass
@@ -33,27 +58,45 @@ class Training:
     LEN_STEP = 0.65
     M_IN_KM = 1000
     MINUTES_IN_HOUR = 60
+    MESSAGE_CLASS = InfoMessage
+    # Формулы тренировки - единственное определение расчета: методы
+    # get_* и пакетный расчет используют функции, которые из них
+    # собирает compile_calculator; каждый метод get_* считает только
+    # свою формулу и те, на которые она ссылается. Выражение может
+    # ссылаться на поля, константы класса и ранее вычисленные distance
+    # и speed.
+    FORMULAS = {
+        'distance': 'action * LEN_STEP / M_IN_KM',
+        'speed': 'distance / duration',
+        'calories': 'None',
+    }
 
     def get_distance(self) -> float:
         """Возвращает дистанцию (в километрах), которую преодолел
         пользователь за время тренировки.
         """
-        return self.action * self.LEN_STEP / self.M_IN_KM
+        return get_training_calculator(type(self), 'distance')(self)
 
     def get_mean_speed(self) -> float:
         """Возвращает дистанцию, пройденную во время тренировки, исходя
         из числа совершенных действий (шагов, гребков и т.д.), длины
         шага и количества метров в километре.
         """
-        return self.get_distance() / self.duration
+        return get_training_calculator(type(self), 'speed')(self)
 
     def get_spent_calories(self) -> float:
         """Получить количество затраченных калорий."""
-        pass
+        return get_training_calculator(type(self), 'calories')(self)
+
+    def get_metrics(self) -> tuple:
+        """Вернуть дистанцию, среднюю скорость и калории за один проход
+        скомпилированных формул FORMULAS.
+        """
+        return get_training_calculator(type(self))(self)
 
     def show_training_info(self) -> InfoMessage:
         """Вернуть информационное сообщение о выполненной тренировке."""
-        return InfoMessage(
+        return self.MESSAGE_CLASS(
             type(self).__name__,
             self.duration,
             self.get_distance(),
@@ -68,14 +111,13 @@ class Running(Training):
     """
     MEAN_SPEED_MULTIPLIER = 18
     MEAN_SPEED_SUBTRACTED = 20
-
-    def get_spent_calories(self):
-        """Вернуть число калорий, сожженных при беге."""
-        return (
-            (self.MEAN_SPEED_MULTIPLIER * self.get_mean_speed()
-             - self.MEAN_SPEED_SUBTRACTED) * self.weight / self.M_IN_KM
-            * self.duration * self.MINUTES_IN_HOUR
-        )
+    FORMULAS = {
+        **Training.FORMULAS,
+        'calories': (
+            '(MEAN_SPEED_MULTIPLIER * speed - MEAN_SPEED_SUBTRACTED)'
+            ' * weight / M_IN_KM * duration * MINUTES_IN_HOUR'
+        ),
+    }
 
 
 @dataclass
@@ -85,15 +127,14 @@ class SportsWalking(Training):
     height: float
     WEIGHT_MULTIPLIER = 0.035
     MEAN_SPEED_MULTIPLIER = 0.029
-
-    def get_spent_calories(self):
-        """Вернуть число калорий, сожженных при спортивной ходьбе."""
-        return (
-            (self.WEIGHT_MULTIPLIER * self.weight
-             + (self.get_mean_speed()**2 // self.height)
-             * self.MEAN_SPEED_MULTIPLIER * self.weight)
-            * self.duration * self.MINUTES_IN_HOUR
-        )
+    FORMULAS = {
+        **Training.FORMULAS,
+        'calories': (
+            '(WEIGHT_MULTIPLIER * weight'
+            ' + (speed**2 // height) * MEAN_SPEED_MULTIPLIER * weight)'
+            ' * duration * MINUTES_IN_HOUR'
+        ),
+    }
 
 
 @dataclass
@@ -103,20 +144,28 @@ class Swimming(Training):
     LEN_STEP = 1.38
     MEAN_SPEED_ADDEND = 1.1
     WEIGHT_MULTIPLIER = 2
+    # Скорость плавания считается по длине бассейна и числу его проходов
+    FORMULAS = {
+        **Training.FORMULAS,
+        'speed': 'length_pool * count_pool / M_IN_KM / duration',
+        'calories': '(speed + MEAN_SPEED_ADDEND) * WEIGHT_MULTIPLIER * weight',
+    }
 
-    def get_mean_speed(self) -> float:
-        """Возвращает дистанцию, пройденную во время плавания, исходя
-        из длины бассейна и количества его проходов.
-        """
-        return (self.length_pool * self.count_pool / self.M_IN_KM
-                / self.duration)
-
-    def get_spent_calories(self):
-        """Вернуть число калорий, сожженных при плавании."""
-        return (
-            (self.get_mean_speed() + self.MEAN_SPEED_ADDEND)
-            * self.WEIGHT_MULTIPLIER * self.weight
-        )
+
+def make_compact(cls, base: type = object, qualname: str = None) -> type:
+    """Создать облегченную копию dataclass-класса с __slots__ вместо
+    __dict__ у экземпляров. Имя класса сохраняется, чтобы сообщения
+    о тренировке не отличались от обычного режима.
+    """
+    namespace = {
+        name: value for name, value in vars(cls).items()
+        if not name.startswith('__')
+    }
+    namespace['__module__'] = cls.__module__
+    namespace['__qualname__'] = qualname or cls.__qualname__
+    namespace['__doc__'] = cls.__doc__
+    namespace['__annotations__'] = dict(vars(cls).get('__annotations__', {}))
+    return dataclass(slots=True)(type(cls.__name__, (base,), namespace))
 
 
 TRAINING_CODES = {
@@ -124,6 +173,10 @@ TRAINING_CODES = {
     'RUN': (Running, len(fields(Running))),
     'WLK': (SportsWalking, len(fields(SportsWalking)))
 }
+# Компактный режим: те же классы, но без __dict__ у экземпляров.
+# Классы и таблицы создаются при первом обращении (load_compact_registry).
+COMPACT_CLASSES = {}
+COMPACT_TRAINING_CODES = {}
 
 # Шаблон ошибки для неверного числа аргументов
 ERR_LEN_DATA_PACKAGE_TEMPLATE = (
@@ -132,6 +185,9 @@ ERR_LEN_DATA_PACKAGE_TEMPLATE = (
 )
 # Шаблон ошибки для неверного кода тренировки
 ERR_TRAINING_TYPE_TEMPLATE = 'Error. Incorrect training code: {training_code}.'
+# Ошибки одного пакета: неверный код или число параметров, нечисловое
+# значение, деление на ноль при нулевой длительности
+PACKAGE_ERRORS = (TypeError, ValueError, ArithmeticError)
 
 
 def is_correct_package(workout_type: str, data) -> bool:
@@ -156,11 +212,1787 @@ def is_correct_package(workout_type: str, data) -> bool:
     return True
 
 
-def read_package(workout_type: str, data) -> Training:
-    """Прочитать данные полученные от датчиков."""
-    # Проверка корректности пакета
-    if is_correct_package(workout_type, data):
-        return TRAINING_CODES[workout_type][0](*data)
+# Коды ошибок пакетной проверки validate_packages
+ERR_TRAINING_TYPE = 1
+ERR_LEN_DATA_PACKAGE = 2
+ERR_DATA_TYPE = 3
+# Шаблон ошибки для нечислового параметра
+ERR_DATA_TYPE_TEMPLATE = (
+    'Wrong package data. Non-numeric parameter for {class_name}: {value!r}.'
+)
+NUMERIC_TYPES = (int, float)
+
+
+def validate_packages(packages: list) -> tuple:
+    """Проверить пачку пакетов без исключений.
+    Возвращает индексы отклоненных пакетов (array 'L') и коды ошибок
+    (bytearray той же длины). Тексты ошибок формирует format_rejects.
+    """
+    arities = {
+        workout_type: args_number
+        for workout_type, (_, args_number) in TRAINING_CODES.items()
+    }
+    rejects = array('L')
+    errors = bytearray()
+    for index, (workout_type, data) in enumerate(packages):
+        args_number = arities.get(workout_type)
+        if args_number is None:
+            error = ERR_TRAINING_TYPE
+        elif len(data) != args_number:
+            error = ERR_LEN_DATA_PACKAGE
+        elif not all(type(value) in NUMERIC_TYPES for value in data):
+            error = ERR_DATA_TYPE
+        else:
+            continue
+        rejects.append(index)
+        errors.append(error)
+    return rejects, errors
+
+
+def format_reject(workout_type: str, data, error: int) -> str:
+    """Сформировать текст ошибки пакета по коду ошибки."""
+    if error == ERR_TRAINING_TYPE:
+        return ERR_TRAINING_TYPE_TEMPLATE.format(training_code=workout_type)
+    workout_class, args_number = TRAINING_CODES[workout_type]
+    if error == ERR_LEN_DATA_PACKAGE:
+        return ERR_LEN_DATA_PACKAGE_TEMPLATE.format(
+            class_name=workout_class.__name__,
+            given_args_number=len(data),
+            expected_args_number=args_number
+        )
+    return ERR_DATA_TYPE_TEMPLATE.format(
+        class_name=workout_class.__name__,
+        value=next(
+            value for value in data if type(value) not in NUMERIC_TYPES
+        )
+    )
+
+
+def format_rejects(packages: list, rejects, errors) -> list:
+    """Сформировать тексты ошибок для результата validate_packages."""
+    return [
+        format_reject(*packages[index], error)
+        for index, error in zip(rejects, errors)
+    ]
+
+
+def make_reader(workout_class: type) -> Callable:
+    """Создать функцию, которая проверяет число параметров пакета и
+    создает экземпляр workout_class. Число полей вычисляется один раз.
+    """
+    args_number = len(fields(workout_class))
+
+    def reader(data) -> Training:
+        if len(data) != args_number:
+            raise ValueError(ERR_LEN_DATA_PACKAGE_TEMPLATE.format(
+                class_name=workout_class.__name__,
+                given_args_number=len(data),
+                expected_args_number=args_number
+            ))
+        return workout_class(*data)
+
+    return reader
+
+
+# Таблицы диспетчеризации: код тренировки -> проверка и создание объекта
+TRAINING_READERS = {
+    code: make_reader(workout_class)
+    for code, (workout_class, _) in TRAINING_CODES.items()
+}
+COMPACT_TRAINING_READERS = {}
+
+
+def load_compact_registry() -> dict:
+    """Создать компактные классы и их таблицы, если их еще нет.
+    Возвращает таблицу COMPACT_TRAINING_READERS.
+    """
+    if not COMPACT_CLASSES:
+        message_class = make_compact(
+            InfoMessage, qualname='CompactInfoMessage'
+        )
+        base = make_compact(Training, qualname='CompactTraining')
+        base.MESSAGE_CLASS = message_class
+        COMPACT_CLASSES.update({
+            'CompactInfoMessage': message_class,
+            'CompactTraining': base,
+            'CompactRunning': make_compact(
+                Running, base, qualname='CompactRunning'
+            ),
+            'CompactSportsWalking': make_compact(
+                SportsWalking, base, qualname='CompactSportsWalking'
+            ),
+            'CompactSwimming': make_compact(
+                Swimming, base, qualname='CompactSwimming'
+            ),
+        })
+    if not COMPACT_TRAINING_READERS:
+        for code, name in (('SWM', 'CompactSwimming'),
+                           ('RUN', 'CompactRunning'),
+                           ('WLK', 'CompactSportsWalking')):
+            compact_class = COMPACT_CLASSES[name]
+            COMPACT_TRAINING_CODES[code] = (
+                compact_class, len(fields(compact_class))
+            )
+            COMPACT_TRAINING_READERS[code] = make_reader(compact_class)
+    return COMPACT_TRAINING_READERS
+
+
+def __getattr__(name: str):
+    """Отдать компактные классы модуля (CompactRunning и др.), создав
+    их при первом обращении.
+    """
+    if name.startswith('Compact'):
+        load_compact_registry()
+        if name in COMPACT_CLASSES:
+            return COMPACT_CLASSES[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def register_training(code: str, workout_class: type,
+                      compact_class: type = None) -> None:
+    """Зарегистрировать новый тип тренировки.
+    Без compact_class компактный режим использует обычный класс.
+    """
+    load_compact_registry()
+    compact_class = compact_class or workout_class
+    TRAINING_CODES[code] = (workout_class, len(fields(workout_class)))
+    COMPACT_TRAINING_CODES[code] = (
+        compact_class, len(fields(compact_class))
+    )
+    TRAINING_READERS[code] = make_reader(workout_class)
+    COMPACT_TRAINING_READERS[code] = make_reader(compact_class)
+
+
+def read_package(workout_type: str, data, compact: bool = False) -> Training:
+    """Прочитать данные полученные от датчиков.
+    При compact=True создается экземпляр компактного класса (__slots__).
+    """
+    readers = TRAINING_READERS
+    if compact:
+        readers = COMPACT_TRAINING_READERS or load_compact_registry()
+    try:
+        reader = readers[workout_type]
+    except KeyError:
+        raise ValueError(ERR_TRAINING_TYPE_TEMPLATE.format(
+            training_code=workout_type
+        )) from None
+    return reader(data)
+
+
+# Порядок вычисления формул тренировки
+FORMULA_ORDER = ('distance', 'speed', 'calories')
+# Скомпилированные функции расчета по (класс тренировки, метрика)
+CALCULATORS = {}
+TRAINING_CALCULATORS = {}
+
+
+def compile_calculator(workout_class: type, metric: str = None) -> Callable:
+    """Скомпилировать FORMULAS класса в плоскую функцию
+    calculate(<поля класса>) -> (distance, speed, calories).
+    С metric функция возвращает только эту метрику и вычисляет лишь ее
+    формулу и формулы метрик, на которые та ссылается.
+    Константы класса подставляются как глобальные имена функции.
+    Функция принимает скаляры или массивы NumPy (поэлементно).
+    """
+    codes = {
+        name: compile(workout_class.FORMULAS[name], workout_class.__name__,
+                      'eval')
+        for name in FORMULA_ORDER
+    }
+    needed = set(FORMULA_ORDER if metric is None else [metric])
+    for name in reversed(FORMULA_ORDER):
+        if name in needed:
+            needed.update(set(codes[name].co_names) & set(FORMULA_ORDER))
+    params = [field.name for field in fields(workout_class)]
+    lines = [f'def calculate({", ".join(params)}):']
+    for name in FORMULA_ORDER:
+        if name in needed:
+            lines.append(f'    {name} = {workout_class.FORMULAS[name]}')
+    result = ', '.join(FORMULA_ORDER) if metric is None else metric
+    lines.append(f'    return {result}')
+    namespace = {
+        name: getattr(workout_class, name)
+        for name in dir(workout_class)
+        if name.isupper()
+        and isinstance(getattr(workout_class, name), (int, float))
+    }
+    exec('\n'.join(lines), namespace)
+    return namespace['calculate']
+
+
+def get_calculator(workout_class: type, metric: str = None) -> Callable:
+    """Вернуть скомпилированную функцию расчета класса тренировки
+    (всех метрик или только metric).
+    """
+    key = (workout_class, metric)
+    calculate = CALCULATORS.get(key)
+    if calculate is None:
+        calculate = CALCULATORS[key] = compile_calculator(
+            workout_class, metric
+        )
+    return calculate
+
+
+def get_training_calculator(workout_class: type,
+                            metric: str = None) -> Callable:
+    """Вернуть функцию calculate_training(training), которая передает
+    поля экземпляра в скомпилированную функцию расчета.
+    """
+    key = (workout_class, metric)
+    calculate = TRAINING_CALCULATORS.get(key)
+    if calculate is None:
+        args = ', '.join(
+            f'training.{field.name}' for field in fields(workout_class)
+        )
+        namespace = {'calculate': get_calculator(workout_class, metric)}
+        exec(
+            f'def calculate_training(training):\n'
+            f'    return calculate({args})',
+            namespace
+        )
+        calculate = TRAINING_CALCULATORS[key] = (
+            namespace['calculate_training']
+        )
+    return calculate
+
+
+def declare_training(code: str, name: str, params: dict, formulas: dict,
+                     constants: dict = None, base: type = Training) -> type:
+    """Объявить и зарегистрировать вид тренировки по описанию.
+    params - дополнительные поля {имя: тип} сверх полей base,
+    formulas - выражения distance/speed/calories (недостающие берутся из
+    base), constants - константы класса. Методы get_* и
+    show_training_info наследуются от Training и считают по формулам.
+    """
+    from dataclasses import make_dataclass
+    workout_class = make_dataclass(
+        name, list(params.items()), bases=(base,),
+        namespace={
+            **(constants or {}),
+            'FORMULAS': {**base.FORMULAS, **formulas},
+        }
+    )
+    workout_class.__module__ = __name__
+    register_training(code, workout_class)
+    return workout_class
+
+
+@lru_cache(maxsize=None)
+def load_numpy():
+    """Вернуть модуль NumPy или None, если он не установлен."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# Точность пакетного расчета: имя типа NumPy -> код типа array.array
+PRECISIONS = {'float64': 'd', 'float32': 'f'}
+ERR_PRECISION_TEMPLATE = 'Error. Unknown precision: {precision}.'
+
+
+def calculate_batch(workout_type: str, columns: dict,
+                    precision: str = 'float64') -> dict:
+    """Рассчитать метрики сразу для пакета тренировок одного типа.
+    columns - словарь {имя поля: колонка значений}; колонки могут быть
+    массивами NumPy, array.array или любыми последовательностями.
+    Возвращает колонки duration, distance, speed и calories: массивы NumPy,
+    если NumPy установлен, иначе array.array.
+    precision='float32' уменьшает вдвое объем результатов; с NumPy расчет
+    идет в float32, без него - в float64 с округлением при сохранении.
+    """
+    if workout_type not in TRAINING_CODES:
+        raise ValueError(ERR_TRAINING_TYPE_TEMPLATE.format(
+            training_code=workout_type
+        ))
+    if precision not in PRECISIONS:
+        raise ValueError(ERR_PRECISION_TEMPLATE.format(precision=precision))
+    typecode = PRECISIONS[precision]
+    workout_class = TRAINING_CODES[workout_type][0]
+    calculate = get_calculator(workout_class)
+    values = [columns[field.name] for field in fields(workout_class)]
+    np = load_numpy()
+    if np is not None:
+        values = [np.asarray(value, dtype=precision) for value in values]
+        distance, speed, calories = calculate(*values)
+        duration = values[1]
+    else:
+        distance = array(typecode)
+        speed = array(typecode)
+        calories = array(typecode)
+        for row in map(calculate, *values):
+            distance.append(row[0])
+            speed.append(row[1])
+            calories.append(row[2])
+        duration = array(typecode, values[1])
+    return {
+        'duration': duration,
+        'distance': distance,
+        'speed': speed,
+        'calories': calories,
+    }
+
+
+class PackageCache:
+    """Ограниченный LRU-кэш результатов для повторяющихся пакетов.
+    Ключ - (код тренировки, кортеж параметров). Хранит InfoMessage и
+    готовую строку сообщения. Ошибочные пакеты не кэшируются.
+    """
+    MAXSIZE = 4096
+
+    def __init__(self, maxsize: int = MAXSIZE, compact: bool = False) -> None:
+        self.maxsize = maxsize
+        self.compact = compact
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, workout_type: str, data) -> tuple:
+        """Вернуть пару (InfoMessage, строка сообщения) для пакета."""
+        key = (workout_type, tuple(data))
+        items = self.items
+        value = items.get(key)
+        if value is not None:
+            self.hits += 1
+            items.move_to_end(key)
+            return value
+        self.misses += 1
+        training = read_package(workout_type, data, self.compact)
+        info = training.show_training_info()
+        value = items[key] = (info, info.get_message())
+        if len(items) > self.maxsize:
+            items.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def get_info(self, workout_type: str, data) -> InfoMessage:
+        """Вернуть InfoMessage пакета (общий для одинаковых пакетов)."""
+        return self.get(workout_type, data)[0]
+
+    def get_message(self, workout_type: str, data) -> str:
+        """Вернуть строку сообщения пакета."""
+        return self.get(workout_type, data)[1]
+
+    def stats(self) -> dict:
+        """Вернуть статистику попаданий, промахов и вытеснений."""
+        return {
+            'size': len(self.items),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class Profiler:
+    """Включаемый по требованию сбор времени этапов обработки пакетов,
+    счетчиков по кодам тренировок и ошибок. Без профайлера обработка
+    идет прежним путем и не платит за замеры; с ним обработка ведет
+    себя так же (кэш, ошибки), профайлер только наблюдает. Счетчики
+    накапливаются по всем запускам с одним профайлером.
+    """
+    STAGES = ('read', 'calculate', 'format', 'cache', 'write')
+    DUMP_INTERVAL = 60.0
+
+    def __init__(self, dump_path: str = None,
+                 dump_interval: float = DUMP_INTERVAL) -> None:
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.started = time.monotonic()
+        self.next_dump = self.started + dump_interval
+        self.stage_times = dict.fromkeys(self.STAGES, 0.0)
+        self.stage_counts = dict.fromkeys(self.STAGES, 0)
+        self.packages = {}
+        self.errors = {}
+
+    def add(self, stage: str, elapsed: float) -> None:
+        """Учесть время одного выполнения этапа."""
+        self.stage_times[stage] += elapsed
+        self.stage_counts[stage] += 1
+
+    def count(self, workout_type: str, error: bool = False) -> None:
+        """Учесть обработанный (или ошибочный) пакет и, если пора,
+        сбросить снимок в файл.
+        """
+        self.packages[workout_type] = self.packages.get(workout_type, 0) + 1
+        if error:
+            self.errors[workout_type] = self.errors.get(workout_type, 0) + 1
+        if self.dump_path is not None and time.monotonic() >= self.next_dump:
+            self.dump()
+
+    def snapshot(self) -> dict:
+        """Вернуть текущие показатели в виде словаря."""
+        elapsed = time.monotonic() - self.started
+        total = sum(self.packages.values())
+        errors = sum(self.errors.values())
+        return {
+            'elapsed': elapsed,
+            'packages': total,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'error_rate': errors / total if total else 0.0,
+            'codes': dict(self.packages),
+            'errors': dict(self.errors),
+            'stages': {
+                stage: {
+                    'count': self.stage_counts[stage],
+                    'total': self.stage_times[stage],
+                    'mean': (self.stage_times[stage] / self.stage_counts[stage]
+                             if self.stage_counts[stage] else 0.0),
+                }
+                for stage in self.STAGES
+            },
+        }
+
+    def dump(self, path: str = None) -> None:
+        """Записать снимок показателей в JSON-файл."""
+        with open(path or self.dump_path, 'w') as file:
+            import json
+            json.dump(self.snapshot(), file, indent=2)
+        self.next_dump = time.monotonic() + self.dump_interval
+
+
+def profile_message(package, profiler: Profiler,
+                    cache: PackageCache = None) -> str:
+    """Сформировать строку сообщения пакета с замером этапов: read
+    (разбор строки и read_package), calculate и format, а с cache -
+    одного этапа cache (получение строки из кэша или ее расчет).
+    """
+    clock = time.perf_counter
+    start = clock()
+    if isinstance(package, str):
+        package = parse_package(package)
+    if cache is not None:
+        message = cache.get_message(*package)
+        profiler.add('cache', clock() - start)
+        return message
+    training = read_package(*package)
+    read = clock()
+    info = training.show_training_info()
+    calculated = clock()
+    message = info.get_message()
+    profiler.add('read', read - start)
+    profiler.add('calculate', calculated - read)
+    profiler.add('format', clock() - calculated)
+    return message
+
+
+def iter_profiled_lines(source: Iterable, profiler: Profiler,
+                        cache: PackageCache = None) -> Iterator[str]:
+    """То же, что iter_lines, но с замером каждого этапа обработки.
+    Ошибочный пакет учитывается в errors профайлера, а ошибка
+    пробрасывается, как и без профайлера.
+    """
+    for package in source:
+        if isinstance(package, str):
+            if not package.strip():
+                continue
+            workout_type = package.split()[0]
+        else:
+            workout_type = package[0]
+        try:
+            message = profile_message(package, profiler, cache)
+        except PACKAGE_ERRORS:
+            profiler.count(workout_type, error=True)
+            raise
+        profiler.count(workout_type)
+        yield message
+
+
+def parse_number(value: str):
+    """Преобразовать строковое значение параметра в int или float."""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_package(line: str) -> tuple:
+    """Разобрать строку пакета вида 'SWM 720 1 80 25 4'."""
+    workout_type, *data = line.split()
+    return workout_type, [parse_number(value) for value in data]
+
+
+def calculate_package(package) -> tuple:
+    """Рассчитать пакет без исключений для ошибочных данных.
+    Пакет - строка (str или bytes) или пара (код, данные). Возвращает
+    (InfoMessage, None) или (None, текст ошибки) для PACKAGE_ERRORS.
+    """
+    try:
+        if isinstance(package, bytes):
+            package = package.decode()
+        if isinstance(package, str):
+            package = parse_package(package)
+        return read_package(*package).show_training_info(), None
+    except PACKAGE_ERRORS as error:
+        return None, str(error)
+
+
+def iter_packages(source: Iterable) -> Iterator[tuple]:
+    """Лениво перебрать пакеты из источника.
+    Источник - любой итерируемый объект: список пар (код, данные), файл
+    или sys.stdin со строками пакетов. Пустые строки пропускаются.
+    """
+    for package in source:
+        if isinstance(package, str):
+            if not package.strip():
+                continue
+            package = parse_package(package)
+        yield package
+
+
+def iter_messages(source: Iterable,
+                  fused: bool = False) -> Iterator[InfoMessage]:
+    """Лениво рассчитать InfoMessage для каждого пакета из источника.
+    При fused=True метрики считаются за один проход (get_metrics).
+    """
+    for workout_type, data in iter_packages(source):
+        training = read_package(workout_type, data)
+        if fused:
+            yield training.MESSAGE_CLASS(
+                type(training).__name__, training.duration,
+                *training.get_metrics()
+            )
+        else:
+            yield training.show_training_info()
+
+
+def iter_lines(source: Iterable, cache: PackageCache = None,
+               profiler: Profiler = None) -> Iterator[str]:
+    """Лениво сформировать строки сообщений для пакетов из источника.
+    С cache повторяющиеся пакеты берутся из LRU-кэша, с profiler
+    замеряется время каждого этапа.
+    """
+    if profiler is not None:
+        yield from iter_profiled_lines(source, profiler, cache)
+        return
+    if cache is not None:
+        for workout_type, data in iter_packages(source):
+            yield cache.get_message(workout_type, data)
+        return
+    for info in iter_messages(source):
+        yield info.get_message()
+
+
+# Число строк, накапливаемых перед одной записью в поток вывода
+WRITE_CHUNK_SIZE = 1024
+
+
+def write_lines(lines: Iterable[str], stream: TextIO = None,
+                chunk_size: int = WRITE_CHUNK_SIZE,
+                profiler: Profiler = None) -> int:
+    """Записать строки в поток крупными блоками вместо print на каждую.
+    Возвращает число записанных строк.
+    """
+    if stream is None:
+        stream = sys.stdout
+    if profiler is None:
+        write = stream.write
+    else:
+        def write(text: str, stream_write=stream.write) -> None:
+            start = time.perf_counter()
+            stream_write(text)
+            profiler.add('write', time.perf_counter() - start)
+    chunk = []
+    count = 0
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            write('\n'.join(chunk) + '\n')
+            count += len(chunk)
+            chunk.clear()
+    if chunk:
+        write('\n'.join(chunk) + '\n')
+        count += len(chunk)
+    return count
+
+
+# Шаблоны вывода сообщений; text совпадает с InfoMessage.TEMPLATE
+OUTPUT_TEMPLATES = {
+    'text': InfoMessage.TEMPLATE,
+    'csv': '{training_type},{duration!r},{distance!r},{speed!r},{calories!r}',
+    'jsonl': (
+        '{{"training_type": "{training_type}", "duration": {duration!r}, '
+        '"distance": {distance!r}, "speed": {speed!r}, '
+        '"calories": {calories!r}}}'
+    ),
+}
+CSV_HEADER = 'training_type,duration,distance,speed,calories'
+ERR_OUTPUT_FORMAT_TEMPLATE = 'Error. Unknown output format: {output_format}.'
+
+
+def compile_template(template: str) -> tuple:
+    """Преобразовать шаблон str.format в шаблон оператора % и функцию,
+    которая достает из сообщения значения полей в нужном порядке.
+    """
+    import string
+    parts = []
+    names = []
+    for literal, name, spec, conversion in string.Formatter().parse(
+        template
+    ):
+        parts.append(literal.replace('%', '%%'))
+        if name is None:
+            continue
+        names.append(name)
+        parts.append('%r' if conversion == 'r' else '%' + (spec or 's'))
+    return ''.join(parts), attrgetter(*names)
+
+
+# Скомпилированные шаблоны заполняются при первом использовании формата
+FORMATTERS = {}
+
+
+def get_formatter(output_format: str) -> tuple:
+    """Вернуть скомпилированный шаблон формата вывода."""
+    formatter = FORMATTERS.get(output_format)
+    if formatter is None:
+        if output_format not in OUTPUT_TEMPLATES:
+            raise ValueError(ERR_OUTPUT_FORMAT_TEMPLATE.format(
+                output_format=output_format
+            ))
+        formatter = FORMATTERS[output_format] = compile_template(
+            OUTPUT_TEMPLATES[output_format]
+        )
+    return formatter
+
+
+def render_messages(messages: Iterable[InfoMessage],
+                    output_format: str = 'text') -> str:
+    """Отформатировать сообщения одним блоком текста, строка на каждое.
+    Форматы: text (как get_message), csv и jsonl.
+    """
+    template, values = get_formatter(output_format)
+    rows = [template % values(info) for info in messages]
+    if not rows:
+        return ''
+    rows.append('')
+    return '\n'.join(rows)
+
+
+def write_messages(messages: Iterable[InfoMessage], stream: TextIO = None,
+                   output_format: str = 'text',
+                   chunk_size: int = WRITE_CHUNK_SIZE) -> int:
+    """Записать сообщения в поток блоками по chunk_size, одной записью
+    на блок. Для csv сначала пишется строка заголовка.
+    Возвращает число записанных сообщений.
+    """
+    if stream is None:
+        stream = sys.stdout
+    get_formatter(output_format)
+    if output_format == 'csv':
+        stream.write(CSV_HEADER + '\n')
+    chunk = []
+    count = 0
+    for info in messages:
+        chunk.append(info)
+        if len(chunk) >= chunk_size:
+            stream.write(render_messages(chunk, output_format))
+            count += len(chunk)
+            chunk.clear()
+    if chunk:
+        stream.write(render_messages(chunk, output_format))
+        count += len(chunk)
+    return count
+
+
+class PackagePipeline:
+    """Конвейер обработки пакетов: чтение -> read_package ->
+    show_training_info -> запись. Чтение источников и запись в поток идут
+    в пуле из io_workers потоков, расчет - в потоке, вызвавшем run.
+    Этапы связаны ограниченными очередями пачек пакетов.
+    Ошибочные пакеты (PACKAGE_ERRORS) не прерывают обработку, а
+    собираются в список (номер источника, номер пакета, текст ошибки).
+    Любая другая ошибка, в том числе ввода-вывода, останавливает все
+    этапы и пробрасывается из run.
+    """
+    CHUNK_SIZE = 256
+    QUEUE_SIZE = 64
+    POLL_TIMEOUT = 0.1
+
+    def __init__(self, stream: TextIO = None, io_workers: int = 2,
+                 output_format: str = 'text', chunk_size: int = CHUNK_SIZE,
+                 queue_size: int = QUEUE_SIZE) -> None:
+        import queue
+        import threading
+        get_formatter(output_format)
+        self.stream = stream
+        self.io_workers = io_workers
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.packages = queue.Queue(queue_size)
+        self.results = queue.Queue(queue_size)
+        self.stop = threading.Event()
+        self.errors = []
+        self.processed = 0
+
+    def put(self, target: queue.Queue, item) -> bool:
+        """Положить элемент в очередь, пока конвейер не остановлен."""
+        import queue
+        while not self.stop.is_set():
+            try:
+                target.put(item, timeout=self.POLL_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(self, number: int, source: Iterable) -> None:
+        """Этап чтения: передать пакеты источника пачками на расчет."""
+        try:
+            chunk = []
+            packages = (
+                package for package in source
+                if not isinstance(package, str) or package.strip()
+            )
+            for index, package in enumerate(packages):
+                chunk.append((number, index, package))
+                if len(chunk) >= self.chunk_size:
+                    if not self.put(self.packages, chunk):
+                        return
+                    chunk = []
+            if chunk:
+                self.put(self.packages, chunk)
+        except BaseException:
+            self.stop.set()
+            raise
+        finally:
+            self.put(self.packages, None)
+
+    def write(self) -> None:
+        """Этап записи: вывести отформатированные пачки в поток."""
+        import queue
+        stream = self.stream or sys.stdout
+        try:
+            while True:
+                try:
+                    text = self.results.get(timeout=self.POLL_TIMEOUT)
+                except queue.Empty:
+                    if self.stop.is_set():
+                        return
+                    continue
+                if text is None:
+                    return
+                stream.write(text)
+        except BaseException:
+            self.stop.set()
+            raise
+
+    def compute(self, chunk: list) -> str:
+        """Этап расчета: рассчитать и отформатировать пачку пакетов."""
+        messages = []
+        for number, index, package in chunk:
+            info, error = calculate_package(package)
+            if error is None:
+                messages.append(info)
+            else:
+                self.errors.append((number, index, error))
+        self.processed += len(messages)
+        return render_messages(messages, self.output_format)
+
+    def calculate(self, sources_number: int) -> None:
+        """Рассчитывать пачки, пока не закончатся все источники."""
+        import queue
+        remaining = sources_number
+        while remaining and not self.stop.is_set():
+            try:
+                chunk = self.packages.get(timeout=self.POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                remaining -= 1
+                continue
+            text = self.compute(chunk)
+            if text:
+                self.put(self.results, text)
+        self.put(self.results, None)
+
+    def run(self, sources: list) -> dict:
+        """Обработать источники и вернуть число пакетов и ошибки."""
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.io_workers + 1) as pool:
+            writer = pool.submit(self.write)
+            readers = [
+                pool.submit(self.read, number, source)
+                for number, source in enumerate(sources)
+            ]
+            try:
+                self.calculate(len(readers))
+            except BaseException:
+                self.stop.set()
+                raise
+            for future in [writer, *readers]:
+                future.result()
+        return {'processed': self.processed, 'errors': self.errors}
+
+
+# Размер шарда входного файла в байтах для параллельной обработки
+SHARD_SIZE = 4 * 1024 * 1024
+# Число шардов в работе на один процесс пула
+SHARDS_PER_WORKER = 2
+
+
+def split_file(path: str, chunk_size: int = SHARD_SIZE) -> list:
+    """Разбить файл на диапазоны байтов (начало, конец) примерно по
+    chunk_size байтов, выровненные по границам строк.
+    """
+    size = os.path.getsize(path)
+    shards = []
+    with open(path, 'rb') as file:
+        start = 0
+        while start < size:
+            file.seek(min(start + chunk_size, size))
+            file.readline()
+            end = min(file.tell(), size)
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def process_shard(path: str, start: int, end: int) -> list:
+    """Обработать диапазон байтов файла и вернуть строки сообщений."""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        chunk = file.read(end - start)
+    return list(iter_lines(chunk.decode().splitlines()))
+
+
+def process_file_parallel(path: str, workers: int = None,
+                          chunk_size: int = SHARD_SIZE) -> Iterator[str]:
+    """Обработать файл пакетов шардами в пуле процессов.
+    Строки сообщений возвращаются в порядке пакетов во входном файле.
+    workers по умолчанию равно числу ядер. В работе одновременно не
+    больше SHARDS_PER_WORKER шардов на процесс, поэтому память не
+    растет с размером файла при медленном потребителе.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            for start, end in split_file(path, chunk_size):
+                pending.append(
+                    executor.submit(process_shard, path, start, end)
+                )
+                if len(pending) >= SHARDS_PER_WORKER * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# Объем распакованных данных архива на одну пачку, байты
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+# Модули распаковки по расширению файла архива
+ARCHIVE_OPENERS = {
+    '.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma', '.lzma': 'lzma'
+}
+
+
+def open_archive(path: str):
+    """Открыть архив пакетов на чтение байтов, распаковывая gzip, bz2
+    и xz/lzma по расширению файла.
+    """
+    import importlib
+    module = ARCHIVE_OPENERS.get(os.path.splitext(path)[1])
+    if module is None:
+        return open(path, 'rb')
+    return importlib.import_module(module).open(path, 'rb')
+
+
+def load_checkpoint(path: str) -> dict:
+    """Прочитать контрольную точку или вернуть начальную."""
+    import json
+    if not os.path.exists(path):
+        return {'offset': 0, 'output_size': 0, 'packages': 0, 'errors': 0}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    """Атомарно записать контрольную точку (через временный файл)."""
+    import json
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(temporary, path)
+
+
+def process_archive(path: str, output_path: str, checkpoint_path: str = None,
+                    chunk_size: int = ARCHIVE_CHUNK_SIZE,
+                    output_format: str = 'text') -> dict:
+    """Обработать архив пакетов, не помещающийся в память, пачками по
+    chunk_size байтов распакованных строк. После каждой пачки вывод
+    сбрасывается на диск, а позиция в архиве и размер вывода
+    сохраняются в контрольной точке. Прерванный запуск продолжается с
+    сохраненной позиции; недописанный хвост вывода отрезается.
+    Ошибочные пакеты (PACKAGE_ERRORS) пропускаются и учитываются в поле
+    errors, чтобы повторный запуск не падал на той же записи.
+    """
+    if checkpoint_path is None:
+        checkpoint_path = output_path + '.checkpoint'
+    checkpoint = load_checkpoint(checkpoint_path)
+    with open_archive(path) as archive, open(output_path, 'ab') as output:
+        output.truncate(checkpoint['output_size'])
+        archive.seek(checkpoint['offset'])
+        while True:
+            lines = archive.readlines(chunk_size)
+            if not lines:
+                break
+            messages = []
+            for line in lines:
+                if not line.strip():
+                    continue
+                info, error = calculate_package(line)
+                if error is None:
+                    messages.append(info)
+                else:
+                    checkpoint['errors'] += 1
+            output.write(render_messages(messages, output_format).encode())
+            output.flush()
+            os.fsync(output.fileno())
+            checkpoint['offset'] += sum(len(line) for line in lines)
+            checkpoint['output_size'] = output.tell()
+            checkpoint['packages'] += len(messages)
+            save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+# Заголовок бинарной записи пакета: код тренировки и число параметров
+WIRE_HEADER = struct.Struct('<3sB')
+# Коды struct для типов полей тренировки
+WIRE_FIELD_FORMATS = {int: 'q', 'int': 'q', float: 'd', 'float': 'd'}
+# Кэш форматов тела записи по кодам тренировок
+WIRE_BODIES = {}
+# Шаблон ошибки для значения, которое нельзя записать в поле записи
+ERR_WIRE_VALUE_TEMPLATE = (
+    'Wrong package data. Cannot encode {class_name} parameters: {error}.'
+)
+# Шаблон ошибки для записи, обрезанной в конце буфера
+ERR_WIRE_TRUNCATED_TEMPLATE = (
+    'Wrong binary data. Truncated record at offset {offset} of {size} bytes.'
+)
+
+
+def get_wire_body(workout_type: str) -> struct.Struct:
+    """Вернуть формат тела бинарной записи для кода тренировки.
+    Формат строится по типам полей dataclass при первом обращении.
+    """
+    body = WIRE_BODIES.get(workout_type)
+    if body is None:
+        if workout_type not in TRAINING_CODES:
+            raise ValueError(ERR_TRAINING_TYPE_TEMPLATE.format(
+                training_code=workout_type
+            ))
+        body = struct.Struct('<' + ''.join(
+            WIRE_FIELD_FORMATS[field.type]
+            for field in fields(TRAINING_CODES[workout_type][0])
+        ))
+        WIRE_BODIES[workout_type] = body
+    return body
+
+
+def encode_package(workout_type: str, data) -> bytes:
+    """Закодировать пакет в бинарную запись фиксированной длины.
+    Целые значения, записанные как float (15000.0), пишутся в целые
+    поля; остальные неподходящие значения - ValueError.
+    """
+    is_correct_package(workout_type, data)
+    header = WIRE_HEADER.pack(workout_type.encode('ascii'), len(data))
+    body = get_wire_body(workout_type)
+    try:
+        return header + body.pack(*data)
+    except struct.error:
+        pass
+    data = [
+        int(value) if code == 'q' and isinstance(value, float)
+        and value.is_integer() else value
+        for code, value in zip(body.format[1:], data)
+    ]
+    try:
+        return header + body.pack(*data)
+    except struct.error as error:
+        raise ValueError(ERR_WIRE_VALUE_TEMPLATE.format(
+            class_name=TRAINING_CODES[workout_type][0].__name__,
+            error=error
+        )) from None
+
+
+def iter_binary_packages(buffer) -> Iterator[tuple]:
+    """Перебрать пакеты (код, данные) из буфера бинарных записей.
+    Буфер (bytes, memoryview, mmap) читается без копирования.
+    Обрезанная запись или неизвестный код - ValueError.
+    """
+    with memoryview(buffer) as view:
+        offset = 0
+        size = len(view)
+        while offset < size:
+            try:
+                code, args_number = WIRE_HEADER.unpack_from(view, offset)
+                workout_type = code.decode('ascii')
+                body = get_wire_body(workout_type)
+                data = body.unpack_from(view, offset + WIRE_HEADER.size)
+            except struct.error:
+                raise ValueError(ERR_WIRE_TRUNCATED_TEMPLATE.format(
+                    offset=offset, size=size
+                )) from None
+            if len(data) != args_number:
+                raise ValueError(ERR_LEN_DATA_PACKAGE_TEMPLATE.format(
+                    class_name=TRAINING_CODES[workout_type][0].__name__,
+                    given_args_number=args_number,
+                    expected_args_number=len(data)
+                ))
+            yield workout_type, data
+            offset += WIRE_HEADER.size + body.size
+
+
+def read_binary_columns(buffer) -> dict:
+    """Разобрать буфер бинарных записей в колонки для calculate_batch.
+    Возвращает словарь {код: {имя поля: array.array}}.
+    """
+    columns = {}
+    for workout_type, data in iter_binary_packages(buffer):
+        code_columns = columns.get(workout_type)
+        if code_columns is None:
+            code_columns = columns[workout_type] = [
+                array(WIRE_FIELD_FORMATS[field.type])
+                for field in fields(TRAINING_CODES[workout_type][0])
+            ]
+        for column, value in zip(code_columns, data):
+            column.append(value)
+    return {
+        workout_type: dict(zip(
+            (field.name for field in fields(TRAINING_CODES[workout_type][0])),
+            code_columns
+        ))
+        for workout_type, code_columns in columns.items()
+    }
+
+
+def iter_binary_file(path: str) -> Iterator[tuple]:
+    """Перебрать пакеты бинарного файла, отображенного в память (mmap)."""
+    import mmap
+    if not os.path.getsize(path):
+        return
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield from iter_binary_packages(buffer)
+
+
+class ResultStore:
+    """Колоночное хранилище рассчитанных InfoMessage.
+    Каждое поле хранится в отдельном файле каталога в виде массива
+    фиксированной длины: код тренировки - 3 байта ASCII, остальные
+    поля - float64. Запись только дописыванием, чтение через mmap.
+    """
+    CODE_COLUMN = 'training_type'
+    FLOAT_COLUMNS = ('duration', 'distance', 'speed', 'calories')
+    CODE_SIZE = 3
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._codes = bytearray()
+        self._floats = {name: array('d') for name in self.FLOAT_COLUMNS}
+        self._maps = {}
+        self._codes_by_name = {}
+        self._repair()
+
+    def _repair(self) -> None:
+        """Обрезать колонки до общего числа целых записей, если запись
+        прервалась между файлами колонок.
+        """
+        sizes = {self.CODE_COLUMN: self.CODE_SIZE}
+        sizes.update(dict.fromkeys(self.FLOAT_COLUMNS, 8))
+        paths = {name: self._column_path(name) for name in sizes}
+        if not all(os.path.exists(path) for path in paths.values()):
+            return
+        rows = min(
+            os.path.getsize(paths[name]) // size
+            for name, size in sizes.items()
+        )
+        for name, size in sizes.items():
+            if os.path.getsize(paths[name]) != rows * size:
+                os.truncate(paths[name], rows * size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, name + '.col')
+
+    def _get_code(self, training_type: str) -> bytes:
+        code = self._codes_by_name.get(training_type)
+        if code is None:
+            self._codes_by_name = {
+                workout_class.__name__: workout_type.encode('ascii')
+                for workout_type, (workout_class, _)
+                in TRAINING_CODES.items()
+            }
+            code = self._codes_by_name[training_type]
+        return code
+
+    def append(self, info: InfoMessage) -> None:
+        """Добавить сообщение в буфер записи."""
+        self._codes += self._get_code(info.training_type)
+        floats = self._floats
+        floats['duration'].append(info.duration)
+        floats['distance'].append(info.distance)
+        floats['speed'].append(info.speed)
+        floats['calories'].append(info.calories)
+
+    def extend(self, messages: Iterable[InfoMessage]) -> None:
+        """Добавить сообщения в буфер записи."""
+        for info in messages:
+            self.append(info)
+
+    def flush(self) -> None:
+        """Дописать накопленные записи в файлы колонок."""
+        if not self._codes:
+            return
+        self._release_maps()
+        for name, values in self._floats.items():
+            with open(self._column_path(name), 'ab') as file:
+                values.tofile(file)
+        # Колонка кода пишется последней и задает число записей
+        with open(self._column_path(self.CODE_COLUMN), 'ab') as file:
+            file.write(self._codes)
+        self._codes = bytearray()
+        self._floats = {name: array('d') for name in self.FLOAT_COLUMNS}
+
+    def close(self) -> None:
+        """Записать буфер и освободить отображения файлов."""
+        self.flush()
+        self._release_maps()
+
+    def _release_maps(self) -> None:
+        # Отображение, на которое еще есть представления из column,
+        # закроется сборщиком мусора вместе с последним из них.
+        for buffer in self._maps.values():
+            try:
+                buffer.close()
+            except BufferError:
+                pass
+        self._maps.clear()
+
+    def __len__(self) -> int:
+        path = self._column_path(self.CODE_COLUMN)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // self.CODE_SIZE
+
+    def column(self, name: str) -> memoryview:
+        """Вернуть колонку как memoryview поверх mmap без копирования.
+        Колонка кода тренировки возвращается байтами, остальные - 'd'.
+        Представление остается действительным и после flush/close, но
+        не видит записей, дописанных после его получения.
+        """
+        if name != self.CODE_COLUMN and name not in self.FLOAT_COLUMNS:
+            raise ValueError(f'Unknown column: {name}.')
+        if not len(self):
+            return memoryview(b'' if name == self.CODE_COLUMN else array('d'))
+        buffer = self._maps.get(name)
+        if buffer is None:
+            import mmap
+            with open(self._column_path(name), 'rb') as file:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[name] = buffer
+        view = memoryview(buffer)
+        return view if name == self.CODE_COLUMN else view.cast('d')
+
+    def training_codes(self, start: int = 0, stop: int = None) -> list:
+        """Вернуть коды тренировок записей в диапазоне [start, stop)."""
+        view = self.column(self.CODE_COLUMN)
+        size = self.CODE_SIZE
+        stop = len(self) if stop is None else stop
+        return [
+            bytes(view[index * size:(index + 1) * size]).decode('ascii')
+            for index in range(start, stop)
+        ]
+
+    def aggregate(self, name: str, workout_type: str = None,
+                  start: int = 0, stop: int = None) -> dict:
+        """Посчитать count, sum, min, max и mean колонки в диапазоне
+        записей [start, stop), при необходимости только для одного кода.
+        """
+        values = self.column(name)[start:stop]
+        if workout_type is not None:
+            codes = self.training_codes(start, start + len(values))
+            values = [
+                value for value, code in zip(values, codes)
+                if code == workout_type
+            ]
+        count = len(values)
+        total = sum(values)
+        return {
+            'count': count,
+            'sum': total,
+            'min': min(values) if count else None,
+            'max': max(values) if count else None,
+            'mean': total / count if count else None,
+        }
+
+
+class Rollup:
+    """Накопительные показатели группы: число записей, сумма, минимум и
+    максимум дистанции, калорий и скорости. Память не зависит от числа
+    записей.
+    """
+    FIELDS = ('distance', 'calories', 'speed')
+    __slots__ = ('count', 'total', 'minimum', 'maximum')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = [0.0, 0.0, 0.0]
+        self.minimum = [None, None, None]
+        self.maximum = [None, None, None]
+
+    def add(self, info: InfoMessage) -> None:
+        """Учесть одно сообщение о тренировке."""
+        self.count += 1
+        for index, value in enumerate(
+            (info.distance, info.calories, info.speed)
+        ):
+            self.total[index] += value
+            if self.count == 1 or value < self.minimum[index]:
+                self.minimum[index] = value
+            if self.count == 1 or value > self.maximum[index]:
+                self.maximum[index] = value
+
+    def result(self) -> dict:
+        """Вернуть сумму, среднее, минимум и максимум по каждому полю."""
+        return {
+            name: {
+                'sum': self.total[index],
+                'mean': self.total[index] / self.count,
+                'min': self.minimum[index],
+                'max': self.maximum[index],
+            }
+            for index, name in enumerate(self.FIELDS)
+        }
+
+
+class RollupAggregator:
+    """Потоковая агрегация InfoMessage по ключу и временному окну.
+    При step=None окна неперекрывающиеся (tumbling), иначе скользящие
+    длиной window с шагом step. Окно выдается, как только время новых
+    записей доходит до его конца; сырые записи не хранятся. Записи для
+    уже выданных окон считаются опоздавшими и отбрасываются; late -
+    число записей, отброшенных хотя бы из одного окна.
+    """
+
+    def __init__(self, window: float, step: float = None,
+                 key: Callable = None) -> None:
+        self.window = window
+        self.step = step or window
+        self.key = key or (lambda info: info.training_type)
+        self.windows = {}
+        self.watermark = None
+        self.late = 0
+
+    def window_starts(self, timestamp: float) -> list:
+        """Вернуть начала всех окон, в которые попадает timestamp."""
+        start = timestamp - timestamp % self.step
+        starts = []
+        while start + self.window > timestamp:
+            starts.append(start)
+            start -= self.step
+        return starts
+
+    def add(self, info: InfoMessage, timestamp: float = None) -> list:
+        """Учесть сообщение и вернуть список закрывшихся окон."""
+        if timestamp is None:
+            timestamp = time.time()
+        key = self.key(info)
+        late = False
+        for start in self.window_starts(timestamp):
+            if (self.watermark is not None
+                    and start + self.window <= self.watermark):
+                late = True
+                continue
+            groups = self.windows.setdefault(start, {})
+            rollup = groups.get(key)
+            if rollup is None:
+                rollup = groups[key] = Rollup()
+            rollup.add(info)
+        self.late += late
+        return self.advance(timestamp)
+
+    def advance(self, timestamp: float) -> list:
+        """Закрыть окна, окончившиеся к моменту timestamp."""
+        if self.watermark is None or timestamp > self.watermark:
+            self.watermark = timestamp
+        emitted = []
+        while self.windows:
+            start = min(self.windows)
+            if start + self.window > self.watermark:
+                break
+            emitted.extend(self.emit(start))
+        return emitted
+
+    def flush(self) -> list:
+        """Закрыть и вернуть все открытые окна."""
+        emitted = []
+        for start in sorted(self.windows):
+            emitted.extend(self.emit(start))
+        return emitted
+
+    def emit(self, start: float) -> list:
+        """Убрать окно и вернуть итоги по его группам."""
+        return [
+            {
+                'key': key,
+                'window_start': start,
+                'window_end': start + self.window,
+                'count': rollup.count,
+                **rollup.result(),
+            }
+            for key, rollup in self.windows.pop(start).items()
+        ]
+
+
+class ResultIndex:
+    """Индекс рассчитанных InfoMessage для запросов по диапазону и
+    top-N без полного перебора. Для каждого типа тренировки и поля
+    (distance, speed, calories) хранятся отсортированные значения и
+    параллельный список номеров записей. Одинаковые сообщения
+    сохраняются один раз.
+    """
+    FIELDS = ('distance', 'speed', 'calories')
+
+    def __init__(self, messages: Iterable[InfoMessage] = ()) -> None:
+        self.records = []
+        self.seen = set()
+        self.indexes = {}
+        for info in messages:
+            self.insert(info)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def insert(self, info: InfoMessage) -> bool:
+        """Добавить сообщение; вернуть False, если оно уже есть."""
+        key = (info.training_type, info.duration, info.distance,
+               info.speed, info.calories)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        record_id = len(self.records)
+        self.records.append(info)
+        indexes = self.indexes.get(info.training_type)
+        if indexes is None:
+            indexes = self.indexes[info.training_type] = {
+                name: ([], []) for name in self.FIELDS
+            }
+        for name, (values, ids) in indexes.items():
+            value = getattr(info, name)
+            position = bisect.bisect_right(values, value)
+            values.insert(position, value)
+            ids.insert(position, record_id)
+        return True
+
+    def range(self, training_type: str, field: str, low: float = None,
+              high: float = None) -> list:
+        """Вернуть сообщения типа training_type, у которых значение field
+        в отрезке [low, high], по возрастанию field.
+        """
+        if training_type not in self.indexes:
+            return []
+        values, ids = self.indexes[training_type][field]
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        stop = len(values) if high is None else bisect.bisect_right(
+            values, high
+        )
+        return [self.records[record_id] for record_id in ids[start:stop]]
+
+    def top(self, training_type: str, field: str, count: int) -> list:
+        """Вернуть count сообщений с наибольшим значением field."""
+        if training_type not in self.indexes or count <= 0:
+            return []
+        ids = self.indexes[training_type][field][1]
+        return [self.records[record_id] for record_id in ids[:-count - 1:-1]]
+
+
+def percentile(values, fraction: float) -> float:
+    """Вернуть перцентиль (fraction от 0 до 1) по ближайшему рангу."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class PackageServer:
+    """Асинхронный сервер приема пакетов от устройств по TCP или
+    Unix-сокету. Каждая строка запроса - пакет вида 'RUN 15000 1 75',
+    на каждую строка ответа - сообщение о тренировке или текст ошибки.
+    Очередь соединения ограничена: когда она заполнена, сервер перестает
+    читать сокет. Пакеты считаются пачками из накопившихся в очереди.
+    """
+    QUEUE_SIZE = 1024
+    BATCH_SIZE = 256
+    LATENCY_WINDOW = 100_000
+
+    def __init__(self, queue_size: int = QUEUE_SIZE,
+                 batch_size: int = BATCH_SIZE) -> None:
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self.server = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0,
+                    path: str = None):
+        """Запустить сервер на TCP-порту или Unix-сокете path."""
+        import asyncio
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Обслужить одно соединение устройства. Если отправка ответов
+        прервалась ошибкой, чтение сокета останавливается, соединение
+        закрывается, а ошибка пробрасывается.
+        """
+        import asyncio
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        tasks = [
+            asyncio.create_task(self.receive(reader, queue)),
+            asyncio.create_task(self.respond(queue, writer)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in tasks:
+                if task.done():
+                    task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            await writer.wait_closed()
+
+    @staticmethod
+    async def receive(reader: asyncio.StreamReader,
+                      queue: asyncio.Queue) -> None:
+        """Читать строки пакетов из соединения в очередь; конец потока
+        отмечается None.
+        """
+        async for line in reader:
+            await queue.put((time.perf_counter(), line))
+        await queue.put(None)
+
+    async def respond(self, queue: asyncio.Queue,
+                      writer: asyncio.StreamWriter) -> None:
+        """Считать пакеты пачками и отправить ответы по порядку."""
+        finished = False
+        while not finished:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            if batch[-1] is None:
+                finished = True
+                batch.pop()
+            if not batch:
+                continue
+            writer.write(''.join(
+                self.process_line(line) + '\n' for _, line in batch
+            ).encode())
+            await writer.drain()
+            done = time.perf_counter()
+            self.latencies.extend(done - received for received, _ in batch)
+
+    @staticmethod
+    def process_line(line: bytes) -> str:
+        """Рассчитать сообщение по строке пакета или вернуть ошибку."""
+        return format_package(line)
+
+    def latency_stats(self) -> dict:
+        """Вернуть p50 и p99 задержки обработки пакета в секундах."""
+        latencies = list(self.latencies)
+        return {
+            'count': len(latencies),
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+        }
+
+
+def format_package(package) -> str:
+    """Вернуть сообщение о тренировке для пакета (строка или пара
+    (код, данные)) или текст ошибки для неверного пакета.
+    """
+    info, error = calculate_package(package)
+    return info.get_message() if error is None else error
+
+
+class Coordinator:
+    """Координатор распределенной обработки пакетов.
+    Поток пакетов режется на пачки, которые рабочие процессы (run_worker)
+    забирают по TCP по мере готовности, поэтому быстрые рабочие берут
+    больше пачек. Когда новых пачек нет, свободный рабочий повторно берет
+    самую давнюю пачку, которую еще обрабатывает другой (перехват работы
+    у отстающего). Пачка рабочего, который отключился или не ответил за
+    timeout, возвращается в очередь: каждая пачка обрабатывается хотя бы
+    один раз, но не больше max_attempts неудачных попыток. Новые пачки
+    выдаются, только пока потребитель iter_lines отстает не больше чем
+    на max_pending пачек, поэтому память не зависит от длины источника.
+    После close рабочие получают команду остановки. Протокол -
+    строки JSON: рабочий шлет {} или результат {"batch_id", "lines"},
+    координатор отвечает {"batch_id", "packages"} или {"stop": true}.
+    """
+    BATCH_SIZE = 512
+    TIMEOUT = 30.0
+    MAX_ATTEMPTS = 3
+    MAX_PENDING = 8
+    POLL_TIMEOUT = 0.1
+
+    def __init__(self, packages: Iterable, batch_size: int = BATCH_SIZE,
+                 timeout: float = TIMEOUT,
+                 max_attempts: int = MAX_ATTEMPTS,
+                 max_pending: int = MAX_PENDING) -> None:
+        import threading
+        self.source = iter(packages)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending
+        self.condition = threading.Condition()
+        self.next_id = 0
+        self.consumed = 0
+        self.stopped = False
+        self.exhausted = False
+        self.retries = deque()
+        self.in_flight = {}
+        self.attempts = {}
+        self.results = {}
+        self.error = None
+        self.server = None
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> tuple:
+        """Начать прием рабочих и вернуть адрес (хост, порт)."""
+        import socket
+        import threading
+        self.server = socket.create_server((host, port))
+        threading.Thread(target=self.accept, daemon=True).start()
+        return self.server.getsockname()[:2]
+
+    def close(self) -> None:
+        """Перестать принимать рабочих и остановить подключенных."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.server is not None:
+            self.server.close()
+
+    def accept(self) -> None:
+        """Принимать подключения рабочих в отдельных потоках."""
+        import threading
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self.serve_worker, args=(connection,), daemon=True
+            ).start()
+
+    def serve_worker(self, connection) -> None:
+        """Раздавать пачки одному рабочему и принимать результаты."""
+        import json
+        batch_id = None
+        with connection, connection.makefile('rwb') as stream:
+            try:
+                while True:
+                    line = stream.readline()
+                    if not line:
+                        raise ConnectionError('worker disconnected')
+                    message = json.loads(line)
+                    if batch_id is not None:
+                        self.complete(batch_id, message['lines'])
+                    batch_id, packages = self.take()
+                    if batch_id is None:
+                        stream.write(b'{"stop": true}\n')
+                        stream.flush()
+                        return
+                    stream.write(json.dumps({
+                        'batch_id': batch_id, 'packages': packages
+                    }).encode() + b'\n')
+                    stream.flush()
+                    connection.settimeout(self.timeout)
+            except (OSError, ValueError, KeyError):
+                if batch_id is not None:
+                    self.fail(batch_id)
+
+    def read_batch(self) -> tuple:
+        """Взять следующую пачку из источника (под блокировкой)."""
+        batch = []
+        for package in self.source:
+            batch.append(package)
+            if len(batch) >= self.batch_size:
+                break
+        if not batch:
+            self.exhausted = True
+            return None, None
+        batch_id = self.next_id
+        self.next_id += 1
+        return batch_id, batch
+
+    def take(self) -> tuple:
+        """Выдать рабочему пачку или (None, None), если работа кончилась
+        или координатор закрыт.
+        """
+        with self.condition:
+            while self.error is None and not self.stopped:
+                batch_id, batch = self.next_batch()
+                if batch_id is not None:
+                    holders = self.in_flight.setdefault(batch_id, [batch, 0])
+                    holders[1] += 1
+                    return batch_id, batch
+                if (self.exhausted and not self.in_flight
+                        and not self.retries):
+                    break
+                self.condition.wait(self.POLL_TIMEOUT)
+        return None, None
+
+    def next_batch(self) -> tuple:
+        """Выбрать пачку для рабочего (под блокировкой): повтор после
+        сбоя, новую из источника, если потребитель не отстал больше чем
+        на max_pending пачек, или перехват у отстающего рабочего.
+        """
+        if self.retries:
+            return self.retries.popleft()
+        if (not self.exhausted
+                and self.next_id - self.consumed < self.max_pending):
+            return self.read_batch()
+        return self.steal()
+
+    def steal(self) -> tuple:
+        """Вернуть давнюю пачку, которую обрабатывает один рабочий."""
+        for batch_id, (batch, holders) in self.in_flight.items():
+            if holders == 1:
+                return batch_id, batch
+        return None, None
+
+    def complete(self, batch_id: int, lines: list) -> None:
+        """Сохранить результат пачки (первый из дублей)."""
+        with self.condition:
+            self.results.setdefault(batch_id, lines)
+            self.in_flight.pop(batch_id, None)
+            self.condition.notify_all()
+
+    def fail(self, batch_id: int) -> None:
+        """Вернуть пачку в очередь после сбоя рабочего."""
+        with self.condition:
+            holders = self.in_flight.get(batch_id)
+            if holders is None:
+                return
+            holders[1] -= 1
+            if holders[1]:
+                return
+            del self.in_flight[batch_id]
+            attempts = self.attempts[batch_id] = (
+                self.attempts.get(batch_id, 0) + 1
+            )
+            if attempts >= self.max_attempts:
+                self.error = RuntimeError(
+                    f'Batch {batch_id} failed {attempts} times.'
+                )
+            else:
+                self.retries.append((batch_id, holders[0]))
+            self.condition.notify_all()
+
+    def iter_lines(self, alive: Callable = None) -> Iterator[str]:
+        """Выдавать строки результатов в порядке входных пакетов.
+        alive() сообщает, остались ли живые рабочие; если их нет, а
+        пачки еще не готовы, ожидание прерывается ошибкой RuntimeError.
+        """
+        batch_id = 0
+        while True:
+            with self.condition:
+                while batch_id not in self.results:
+                    if self.error is not None:
+                        raise self.error
+                    if self.exhausted and batch_id >= self.next_id:
+                        return
+                    if alive is not None and not alive():
+                        raise RuntimeError(ERR_NO_WORKERS)
+                    self.condition.wait(self.POLL_TIMEOUT)
+                lines = self.results.pop(batch_id)
+                self.consumed = batch_id + 1
+                self.condition.notify_all()
+            yield from lines
+            batch_id += 1
+
+
+# Текст ошибки, когда все рабочие завершились раньше координатора
+ERR_NO_WORKERS = 'All workers exited before the work was done.'
+
+
+def run_worker(host: str, port: int) -> int:
+    """Рабочий процесс: брать пачки у координатора, пока они есть.
+    Возвращает число обработанных пачек.
+    """
+    import json
+    import socket
+    processed = 0
+    with socket.create_connection((host, port)) as connection:
+        with connection.makefile('rwb') as stream:
+            stream.write(b'{}\n')
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if message.get('stop'):
+                    break
+                stream.write(json.dumps({
+                    'batch_id': message['batch_id'],
+                    'lines': [
+                        format_package(package)
+                        for package in message['packages']
+                    ],
+                }).encode() + b'\n')
+                stream.flush()
+                processed += 1
+    return processed
+
+
+# Число пачек на рабочего, на которое координатор может опередить
+# потребителя результатов
+PENDING_PER_WORKER = 4
+
+
+def run_cluster(packages: Iterable, workers: int = 2,
+                batch_size: int = Coordinator.BATCH_SIZE) -> Iterator[str]:
+    """Обработать пакеты координатором и workers рабочими процессами
+    на локальной машине; строки выдаются в порядке пакетов.
+    Если все рабочие процессы завершились, не доделав работу,
+    выбрасывается RuntimeError.
+    """
+    import multiprocessing
+    coordinator = Coordinator(
+        packages, batch_size, max_pending=PENDING_PER_WORKER * workers
+    )
+    host, port = coordinator.start()
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(host, port))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        yield from coordinator.iter_lines(
+            lambda: any(process.is_alive() for process in processes)
+        )
+    finally:
+        coordinator.close()
+        for process in processes:
+            process.join()
 
 
 def main(training: Training) -> None:
@@ -168,12 +2000,66 @@ def main(training: Training) -> None:
     print(training.show_training_info().get_message())
 
 
-if __name__ == '__main__':
-    PACKAGES = [
-        ('SWM', [720, 1, 80, 25, 4]),
-        ('RUN', [15000, 1, 75]),
-        ('WLK', [9000, 1, 75, 180]),
-    ]
+def iter_cli_packages(paths: list, binary: bool = False) -> Iterator:
+    """Перебрать пакеты из файлов командной строки ('-' - stdin)."""
+    for path in paths:
+        if binary:
+            if path == '-':
+                yield from iter_binary_packages(sys.stdin.buffer.read())
+            else:
+                yield from iter_binary_file(path)
+        elif path == '-':
+            yield from iter_packages(sys.stdin)
+        else:
+            with open(path) as file:
+                yield from iter_packages(file)
+
 
-    for workout_type, data in PACKAGES:
-        main(read_package(workout_type, data))
+def cli(argv: list = None) -> int:
+    """Точка входа командной строки: прочитать пакеты из файлов или
+    stdin и вывести сообщения о тренировках.
+    Возвращает код завершения процесса.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='homework',
+        description='Расчет показателей тренировок по пакетам датчиков.'
+    )
+    parser.add_argument(
+        'paths', nargs='*', default=['-'],
+        help="файлы пакетов вида 'RUN 15000 1 75', '-' - stdin"
+    )
+    parser.add_argument(
+        '--format', dest='output_format', default='text',
+        choices=sorted(OUTPUT_TEMPLATES), help='формат вывода'
+    )
+    parser.add_argument(
+        '--binary', action='store_true',
+        help='файлы в бинарном формате записей (encode_package)'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=0,
+        help='обрабатывать текстовые файлы шардами в пуле процессов'
+    )
+    args = parser.parse_args(argv)
+    parallel = (args.workers and not args.binary
+                and args.output_format == 'text' and '-' not in args.paths)
+    try:
+        if parallel:
+            for path in args.paths:
+                write_lines(process_file_parallel(path, args.workers))
+        else:
+            write_messages(
+                (read_package(*package).show_training_info()
+                 for package in iter_cli_packages(args.paths, args.binary)),
+                output_format=args.output_format
+            )
+    except (OSError, *PACKAGE_ERRORS) as error:
+        sys.stdout.flush()
+        print(error, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,96 @@
+import json
+from itertools import islice
+
+import pytest
+
+import benchmark
+import homework
+
+
+def test_generate_packages():
+    packages = benchmark.generate_packages(300, {'SWM': 1, 'RUN': 0}, seed=1)
+    assert len(packages) == 300
+    assert {workout_type for workout_type, _ in packages} == {'SWM'}
+    for package in packages:
+        assert homework.is_correct_package(*package)
+    assert packages == benchmark.generate_packages(
+        300, {'SWM': 1, 'RUN': 0}, seed=1
+    ), 'Синтетическая нагрузка должна воспроизводиться по seed.'
+
+
+def test_run_benchmarks():
+    results = benchmark.run_benchmarks(count=30, repeat=1)
+    for name in ['read_package', 'is_correct_package', 'show_training_info',
+                 'get_message', 'Swimming.get_spent_calories',
+                 'Running.get_spent_calories',
+                 'SportsWalking.get_spent_calories']:
+        assert results[name] > 0
+
+
+def test_compare():
+    baseline = {'read_package': 100.0, 'get_message': 100.0}
+    results = {'read_package': 125.0, 'get_message': 105.0, 'new': 1.0}
+    assert benchmark.compare(results, baseline) == {
+        'read_package': pytest.approx(0.25)
+    }
+
+
+def test_main_baseline(tmp_path, capsys):
+    output = tmp_path / 'bench.json'
+    argv = ['--count', '30', '--repeat', '1', '--mix', 'RUN=1,WLK=1']
+    assert benchmark.main(argv + ['--output', str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report['unit'] == 'ns/op'
+    assert report['mix'] == {'RUN': 1.0, 'WLK': 1.0}
+    report['results'] = {name: 1e-3 for name in report['results']}
+    output.write_text(json.dumps(report))
+    assert benchmark.main(argv + ['--baseline', str(output)]) == 1
+    assert 'REGRESSION' in capsys.readouterr().err
+
+
+def test_generate_traffic():
+    traffic = benchmark.generate_traffic(
+        {'SWM': 1, 'RUN': 3, 'WLK': 1}, duplicate_ratio=0.2,
+        malformed_ratio=0.1, seed=2
+    )
+    packages = list(islice(traffic, 5000))
+    rejects, _ = homework.validate_packages(packages)
+    rejected = set(rejects)
+    assert 0.07 < len(rejects) / len(packages) < 0.13
+    valid = [
+        package for index, package in enumerate(packages)
+        if index not in rejected
+    ]
+    for workout_type, data in valid:
+        assert len(data) == homework.TRAINING_CODES[workout_type][1]
+    unique = {(code, tuple(data)) for code, data in valid}
+    assert 0.15 < 1 - len(unique) / len(valid) < 0.3
+    running = sum(code == 'RUN' for code, _ in valid) / len(valid)
+    assert 0.5 < running < 0.7
+
+
+def test_soak():
+    reports = []
+    result = benchmark.soak(0.3, rate=2000, malformed_ratio=0.5,
+                            interval=0.1, processor='cache',
+                            report=reports.append)
+    assert result == reports
+    assert len(reports) >= 2
+    for report in reports:
+        assert report['p50'] <= report['p99']
+        assert 0.2 < report['error_rate'] < 0.8
+        assert {'throughput', 'rss', 'rss_growth', 'packages'} <= set(report)
+    assert reports[-1]['elapsed'] >= 0.3
+    assert reports[-1]['packages'] <= 2000 * 0.3 + 10
+
+
+def test_latency_sample():
+    sample = benchmark.LatencySample(size=100, seed=1)
+    for value in range(10000):
+        sample.add(float(value))
+    assert sample.count == 10000
+    assert len(sample.values) == 100, 'Выборка не должна расти.'
+    assert 3000 < sample.percentile(0.5) < 7000
+    sample.clear()
+    sample.add(5.0)
+    assert sample.percentile(0.99) == 5.0
@@ -1,3 +1,4 @@
+import json
 import re
 import pytest
 import types
@@ -363,3 +364,1008 @@ def test_main_output(input_data, expected):
     assert get_message_output == expected, (
         'Метод `main` должен печатать результат в консоль.\n'
     )
+
+
+@pytest.mark.parametrize('workout_type, packages', [
+    ('SWM', [[720, 1, 80, 25, 40], [420, 4, 20, 42, 4], [1206, 12, 6, 12, 6]]),
+    ('RUN', [[9000, 1, 75], [420, 4, 20], [1206, 12, 6]]),
+    ('WLK', [[9000, 1, 75, 180], [420, 4, 20, 42], [1206, 12, 6, 12]]),
+])
+def test_calculate_batch(workout_type, packages):
+    from array import array
+    workout_class = homework.TRAINING_CODES[workout_type][0]
+    names = [field.name for field in homework.fields(workout_class)]
+    columns = {
+        name: array('d', column)
+        for name, column in zip(names, zip(*packages))
+    }
+    result = homework.calculate_batch(workout_type, columns)
+    for index, data in enumerate(packages):
+        expected = (data[1], *reference_metrics(workout_type, data))
+        for field, value in zip(
+            ['duration', 'distance', 'speed', 'calories'], expected
+        ):
+            assert result[field][index] == value, (
+                'Пакетный расчет `calculate_batch` должен совпадать '
+                f'с расчетом по исходным формулам: поле {field}.'
+            )
+
+
+@pytest.mark.parametrize('precision, tolerance', [
+    ('float64', 0),
+    ('float32', 1e-5),
+])
+def test_calculate_batch_numpy(precision, tolerance):
+    np = pytest.importorskip('numpy')
+    packages = random_packages(500, seed=7)
+    for workout_type in ['SWM', 'RUN', 'WLK']:
+        rows = [data for code, data in packages if code == workout_type]
+        workout_class = homework.TRAINING_CODES[workout_type][0]
+        names = [field.name for field in homework.fields(workout_class)]
+        columns = {
+            name: np.array(column) for name, column in zip(names, zip(*rows))
+        }
+        result = homework.calculate_batch(workout_type, columns, precision)
+        calculate = homework.get_calculator(workout_class)
+        for field in ['duration', 'distance', 'speed', 'calories']:
+            assert isinstance(result[field], np.ndarray)
+            assert result[field].dtype == np.dtype(precision)
+        for index, data in enumerate(rows):
+            for field, value in zip(['distance', 'speed', 'calories'],
+                                    calculate(*data)):
+                assert float(result[field][index]) == pytest.approx(
+                    value, rel=tolerance, abs=tolerance
+                ), f'{precision}: {workout_type} {data} {field}'
+
+
+def test_iter_lines_streaming():
+    from io import StringIO
+    source = StringIO(
+        'SWM 720 1 80 25 40\n'
+        '\n'
+        'RUN 1206 12 6\n'
+        'WLK 9000 1 75 180\n'
+    )
+    lines = homework.iter_lines(source)
+    assert not isinstance(lines, list), (
+        'Функция `iter_lines` должна возвращать ленивый итератор.'
+    )
+    output = StringIO()
+    count = homework.write_lines(lines, output, chunk_size=2)
+    assert count == 3
+    assert output.getvalue().splitlines() == [
+        homework.read_package(workout_type, data)
+        .show_training_info().get_message()
+        for workout_type, data in [
+            ('SWM', [720, 1, 80, 25, 40]),
+            ('RUN', [1206, 12, 6]),
+            ('WLK', [9000, 1, 75, 180]),
+        ]
+    ]
+
+
+def test_parse_package():
+    assert homework.parse_package('SWM 720 1.5 80 25 4') == (
+        'SWM', [720, 1.5, 80, 25, 4]
+    )
+
+
+def test_process_file_parallel(tmp_path):
+    packages = [
+        'SWM 720 1 80 25 40',
+        'RUN 1206 12 6',
+        'WLK 9000 1 75 180',
+    ] * 50
+    path = tmp_path / 'packages.txt'
+    path.write_text('\n'.join(packages) + '\n')
+    shards = homework.split_file(str(path), chunk_size=100)
+    assert len(shards) > 1
+    assert shards[0][0] == 0 and shards[-1][1] == path.stat().st_size
+    result = list(homework.process_file_parallel(
+        str(path), workers=2, chunk_size=100
+    ))
+    assert result == list(homework.iter_lines(packages)), (
+        'Параллельная обработка должна сохранять порядок пакетов.'
+    )
+
+
+def test_process_file_parallel_window(tmp_path, monkeypatch):
+    import concurrent.futures
+    submitted = []
+
+    class Executor(concurrent.futures.ThreadPoolExecutor):
+        def submit(self, *args):
+            submitted.append(args)
+            return super().submit(*args)
+
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', Executor)
+    path = tmp_path / 'packages.txt'
+    path.write_text('RUN 9000 1 75\n' * 500)
+    lines = homework.process_file_parallel(str(path), workers=2,
+                                           chunk_size=100)
+    next(lines)
+    assert len(submitted) == 2 * homework.SHARDS_PER_WORKER, (
+        'Число шардов в работе должно быть ограничено.'
+    )
+    assert len(list(lines)) == 499
+    assert len(submitted) == len(homework.split_file(str(path), 100))
+
+
+@pytest.mark.parametrize('input_data', [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [1206, 12, 6]),
+    ('WLK', [9000, 1, 75, 180]),
+])
+def test_read_package_compact(input_data):
+    regular = homework.read_package(*input_data)
+    compact = homework.read_package(*input_data, compact=True)
+    assert not hasattr(compact, '__dict__'), (
+        'Компактные классы тренировок должны использовать `__slots__`.'
+    )
+    info = compact.show_training_info()
+    assert not hasattr(info, '__dict__'), (
+        'Компактный режим должен создавать компактный `InfoMessage`.'
+    )
+    assert type(compact).__name__ == type(regular).__name__
+    assert info.get_message() == (
+        regular.show_training_info().get_message()
+    ), 'Сообщения в компактном режиме должны совпадать с обычными.'
+
+
+@pytest.mark.parametrize('input_data, message', [
+    (('XXX', [1, 2, 3]), 'Incorrect training code: XXX'),
+    (('RUN', [1, 2]), 'Given: 2, expected: 3'),
+])
+def test_read_package_errors(input_data, message):
+    with pytest.raises(ValueError, match=message):
+        homework.read_package(*input_data)
+
+
+def test_register_training(monkeypatch):
+    for table in ['TRAINING_CODES', 'COMPACT_TRAINING_CODES',
+                  'TRAINING_READERS', 'COMPACT_TRAINING_READERS']:
+        monkeypatch.setattr(homework, table, getattr(homework, table).copy())
+
+    class Rowing(homework.Running):
+        LEN_STEP = 1.5
+
+    homework.register_training('ROW', Rowing)
+    training = homework.read_package('ROW', [1000, 1, 70])
+    assert isinstance(training, Rowing)
+    assert training.get_distance() == 1.5
+    assert isinstance(homework.read_package('ROW', [1, 1, 1], compact=True),
+                      Rowing)
+
+
+def test_binary_packages(tmp_path):
+    packages = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [1206, 12, 6]),
+        ('WLK', [9000, 1.5, 75, 180]),
+        ('RUN', [9000, 1, 75]),
+    ]
+    buffer = b''.join(
+        homework.encode_package(workout_type, data)
+        for workout_type, data in packages
+    )
+    decoded = list(homework.iter_binary_packages(buffer))
+    assert [(code, list(data)) for code, data in decoded] == packages
+    path = tmp_path / 'packages.bin'
+    path.write_bytes(buffer)
+    assert [
+        homework.read_package(*package).show_training_info()
+        for package in homework.iter_binary_file(str(path))
+    ] == [
+        homework.read_package(*package).show_training_info()
+        for package in packages
+    ]
+    columns = homework.read_binary_columns(buffer)
+    assert list(columns['RUN']['action']) == [1206, 9000]
+    result = homework.calculate_batch('RUN', columns['RUN'])
+    assert result['calories'][1] == 383.85
+
+
+def test_encode_package_values():
+    assert homework.encode_package('RUN', [15000.0, 1, 75]) == (
+        homework.encode_package(*homework.parse_package('RUN 15000 1 75'))
+    )
+    for data in [[15000.5, 1, 75], [15000, 'n/a', 75], [2 ** 70, 1, 75]]:
+        with pytest.raises(ValueError, match='Cannot encode Running'):
+            homework.encode_package('RUN', data)
+
+
+def test_binary_packages_errors(tmp_path, capsys):
+    buffer = homework.encode_package('RUN', [9000, 1, 75]) * 2
+    with pytest.raises(ValueError, match='Truncated record at offset 28'):
+        list(homework.iter_binary_packages(buffer[:-1]))
+    path = tmp_path / 'truncated.bin'
+    path.write_bytes(buffer[:-5])
+    with pytest.raises(ValueError, match='Truncated record'):
+        list(homework.iter_binary_file(str(path)))
+    path.write_bytes(b'ZZZ' + buffer[3:])
+    with pytest.raises(ValueError, match='Incorrect training code: ZZZ'):
+        list(homework.iter_binary_file(str(path)))
+    path.write_bytes(buffer[:-5])
+    assert homework.cli(['--binary', str(path)]) == 1
+    assert 'Truncated record' in capsys.readouterr().err
+
+
+def test_result_store(tmp_path):
+    packages = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [9000, 1, 75]),
+        ('WLK', [9000, 1, 75, 180]),
+        ('RUN', [1206, 12, 6]),
+    ]
+    messages = [
+        homework.read_package(*package).show_training_info()
+        for package in packages
+    ]
+    with homework.ResultStore(str(tmp_path / 'store')) as store:
+        store.extend(messages[:2])
+        store.flush()
+        store.extend(messages[2:])
+    store = homework.ResultStore(str(tmp_path / 'store'))
+    assert len(store) == 4
+    assert store.training_codes() == ['SWM', 'RUN', 'WLK', 'RUN']
+    assert list(store.column('calories')) == [
+        info.calories for info in messages
+    ]
+    running = store.aggregate('distance', workout_type='RUN')
+    assert running['count'] == 2
+    assert running['sum'] == messages[1].distance + messages[3].distance
+    assert store.aggregate('speed', start=1, stop=3)['max'] == 5.85
+    store.close()
+
+
+def test_result_store_live_view(tmp_path):
+    info = homework.read_package('RUN', [9000, 1, 75]).show_training_info()
+    with homework.ResultStore(str(tmp_path / 'store')) as store:
+        store.append(info)
+        store.flush()
+        calories = store.column('calories')
+        store.append(info)
+        store.flush()
+        assert list(calories) == [info.calories]
+        assert list(store.column('calories')) == [info.calories] * 2
+        store.append(info)
+    assert len(store) == 3, 'Живое представление не должно мешать записи.'
+    assert list(calories) == [info.calories]
+
+
+def test_result_store_interrupted_flush(tmp_path, monkeypatch):
+    info = homework.read_package('RUN', [9000, 1, 75]).show_training_info()
+    path = str(tmp_path / 'store')
+    with homework.ResultStore(path) as store:
+        store.append(info)
+    store = homework.ResultStore(path)
+    store.append(info)
+    column_path = store._column_path
+
+    def crash(name):
+        if name == 'calories':
+            raise OSError('crash')
+        return column_path(name)
+
+    monkeypatch.setattr(store, '_column_path', crash)
+    with pytest.raises(OSError):
+        store.flush()
+    monkeypatch.undo()
+    assert len(homework.ResultStore(path)) == 1, (
+        'Прерванная запись не должна добавлять неполные записи.'
+    )
+    with homework.ResultStore(path) as store:
+        store.append(info)
+    store = homework.ResultStore(path)
+    assert len(store) == 2
+    assert list(store.column('calories')) == [info.calories] * 2
+    assert list(store.column('distance')) == [info.distance] * 2
+    store.close()
+
+
+def test_package_server():
+    import asyncio
+    packages = [
+        b'SWM 720 1 80 25 40\n',
+        b'RUN 1206 12 6\n',
+        b'XXX 1 2 3\n',
+        b'WLK 9000 1 75 180\n',
+    ]
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.writelines(packages)
+        writer.write_eof()
+        response = (await reader.read()).decode().splitlines()
+        writer.close()
+        return response
+
+    async def run():
+        server = homework.PackageServer(queue_size=2, batch_size=2)
+        async with await server.start() as tcp_server:
+            port = tcp_server.sockets[0].getsockname()[1]
+            responses = await asyncio.gather(
+                *[client(port) for _ in range(3)]
+            )
+        return server, responses
+
+    server, responses = asyncio.run(run())
+    expected = [
+        homework.PackageServer.process_line(line) for line in packages
+    ]
+    assert expected[2] == 'Error. Incorrect training code: XXX.'
+    assert responses == [expected] * 3
+    stats = server.latency_stats()
+    assert stats['count'] == 12
+    assert stats['p50'] <= stats['p99']
+
+
+def test_package_server_errors(monkeypatch):
+    import asyncio
+
+    async def request(port, lines):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.writelines(lines)
+        writer.write_eof()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response.decode().splitlines()
+
+    async def run(lines):
+        server = homework.PackageServer(queue_size=2, batch_size=1)
+        async with await server.start() as tcp_server:
+            port = tcp_server.sockets[0].getsockname()[1]
+            return await request(port, lines)
+
+    poison = [b'RUN 9000 0 75\n', b'RUN 9000 1 75\n', b'\xff\n']
+    response = asyncio.run(run(poison))
+    assert response[0].endswith('division by zero')
+    assert response[1] == homework.format_package('RUN 9000 1 75')
+    assert len(response) == 3
+
+    def process_line(line):
+        raise RuntimeError('bug')
+
+    monkeypatch.setattr(homework.PackageServer, 'process_line',
+                        staticmethod(process_line))
+    assert asyncio.run(run([b'RUN 9000 1 75\n'] * 50)) == [], (
+        'Сбой отправки ответов должен закрывать соединение.'
+    )
+
+
+def test_package_cache():
+    cache = homework.PackageCache(maxsize=2)
+    packages = [
+        ('RUN', [9000, 1, 75]),
+        ('RUN', [9000, 1, 75]),
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('WLK', [9000, 1, 75, 180]),
+        ('RUN', [9000, 1, 75]),
+    ]
+    assert list(homework.iter_lines(packages, cache=cache)) == list(
+        homework.iter_lines(packages)
+    )
+    assert cache.stats() == {
+        'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 4, 'evictions': 2
+    }
+    with pytest.raises(ValueError):
+        cache.get('XXX', [1])
+    assert cache.stats()['size'] == 2
+
+
+def test_profiler(tmp_path):
+    from io import StringIO
+    dump_path = tmp_path / 'profile.json'
+    profiler = homework.Profiler(str(dump_path), dump_interval=0)
+    packages = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [1206, 12, 6]),
+        ('RUN', [9000, 1, 75]),
+    ]
+    output = StringIO()
+    homework.write_lines(
+        homework.iter_lines(packages, profiler=profiler), output,
+        profiler=profiler
+    )
+    assert output.getvalue().splitlines() == list(
+        homework.iter_lines(packages)
+    )
+    for bad in [('RUN', [1]), 'RUN 9000 0 75', 'RUN abc 1 75', ('XXX', [1])]:
+        with pytest.raises(homework.PACKAGE_ERRORS) as profiled:
+            list(homework.iter_lines([bad], profiler=profiler))
+        with pytest.raises(profiled.type):
+            list(homework.iter_lines([bad]))
+    snapshot = profiler.snapshot()
+    assert snapshot['codes'] == {'SWM': 1, 'RUN': 5, 'XXX': 1}
+    assert snapshot['errors'] == {'RUN': 3, 'XXX': 1}
+    assert snapshot['error_rate'] == 4 / 7
+    assert snapshot['stages']['read']['count'] == 3
+    assert snapshot['stages']['calculate']['count'] == 3
+    assert snapshot['stages']['write']['count'] == 1
+    cache = homework.PackageCache()
+    assert list(homework.iter_lines(
+        packages * 2, cache=cache, profiler=profiler
+    )) == list(homework.iter_lines(packages * 2)), (
+        'Профайлер не должен отключать кэш.'
+    )
+    assert cache.stats()['hits'] == 3
+    assert profiler.snapshot()['stages']['cache']['count'] == 6
+    assert json.loads(dump_path.read_text())['packages'] == 13
+
+
+def test_rollup_aggregator_tumbling():
+    run = homework.read_package('RUN', [9000, 1, 75]).show_training_info()
+    swim = homework.read_package(
+        'SWM', [720, 1, 80, 25, 40]
+    ).show_training_info()
+    aggregator = homework.RollupAggregator(window=10)
+    assert aggregator.add(run, 1) == []
+    assert aggregator.add(run, 5) == []
+    assert aggregator.add(swim, 9) == []
+    emitted = aggregator.add(run, 12)
+    assert [(item['key'], item['count']) for item in emitted] == [
+        ('Running', 2), ('Swimming', 1)
+    ]
+    assert emitted[0]['window_start'] == 0
+    assert emitted[0]['calories']['sum'] == 2 * run.calories
+    assert emitted[0]['speed']['max'] == run.speed
+    aggregator.add(run, 3)
+    assert aggregator.late == 1
+    assert aggregator.flush()[0]['window_start'] == 10
+
+
+def test_rollup_aggregator_sliding():
+    run = homework.read_package('RUN', [9000, 1, 75]).show_training_info()
+    aggregator = homework.RollupAggregator(window=10, step=5)
+    aggregator.add(run, 7)
+    emitted = aggregator.add(run, 11)
+    assert [(item['window_start'], item['count']) for item in emitted] == [
+        (0, 1)
+    ]
+    assert [(item['window_start'], item['count'])
+            for item in aggregator.flush()] == [(5, 2), (10, 1)]
+    late = homework.RollupAggregator(window=10, step=5)
+    late.add(run, 20)
+    late.add(run, 3)
+    assert late.late == 1, 'Опоздавшая запись учитывается один раз.'
+
+
+MESSAGES_PACKAGES = [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [1206, 12, 6]),
+    ('WLK', [9000, 1.5, 75, 180]),
+]
+
+
+def test_render_messages_text():
+    messages = list(homework.iter_messages(MESSAGES_PACKAGES))
+    assert homework.render_messages(messages) == ''.join(
+        info.get_message() + '\n' for info in messages
+    ), 'Формат text должен совпадать с `InfoMessage.get_message`.'
+    assert homework.render_messages([]) == ''
+    with pytest.raises(ValueError, match='Unknown output format: xml'):
+        homework.render_messages(messages, 'xml')
+
+
+def test_write_messages_formats():
+    import csv
+    from io import StringIO
+    messages = list(homework.iter_messages(MESSAGES_PACKAGES))
+    output = StringIO()
+    assert homework.write_messages(messages, output, 'csv', 2) == 3
+    rows = list(csv.DictReader(StringIO(output.getvalue())))
+    assert [row['training_type'] for row in rows] == [
+        'Swimming', 'Running', 'SportsWalking'
+    ]
+    assert float(rows[1]['calories']) == messages[1].calories
+    output = StringIO()
+    homework.write_messages(messages, output, 'jsonl')
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert records[2]['distance'] == messages[2].distance
+    assert records[0]['training_type'] == 'Swimming'
+
+
+def test_package_pipeline():
+    from io import StringIO
+    first = StringIO('SWM 720 1 80 25 40\nRUN 1 2\n\nRUN 1206 12 6\n')
+    second = [('XXX', [1]), ('WLK', [9000, 1, 75, 180]), 'RUN abc 1 2']
+    output = StringIO()
+    pipeline = homework.PackagePipeline(output, io_workers=2, chunk_size=1)
+    result = pipeline.run([first, second])
+    assert result['processed'] == 3
+    assert sorted(
+        (number, index) for number, index, _ in result['errors']
+    ) == [(0, 1), (1, 0), (1, 2)]
+    assert sorted(output.getvalue().splitlines()) == sorted(
+        homework.iter_lines([
+            ('SWM', [720, 1, 80, 25, 40]),
+            ('RUN', [1206, 12, 6]),
+            ('WLK', [9000, 1, 75, 180]),
+        ])
+    )
+
+
+def test_package_pipeline_io_error():
+    class BrokenStream:
+        def write(self, text):
+            raise OSError('disk full')
+
+    pipeline = homework.PackagePipeline(BrokenStream(), queue_size=1,
+                                        chunk_size=1)
+    with pytest.raises(OSError, match='disk full'):
+        pipeline.run([[('RUN', [9000, 1, 75])] * 100])
+
+
+def test_package_pipeline_source_error():
+    def source():
+        yield ('RUN', [9000, 1, 75])
+        raise OSError('connection lost')
+
+    pipeline = homework.PackagePipeline(chunk_size=1)
+    with pytest.raises(OSError, match='connection lost'):
+        pipeline.run([source()])
+
+
+def test_package_pipeline_bad_values():
+    from io import StringIO
+    output = StringIO()
+    pipeline = homework.PackagePipeline(output, chunk_size=1, queue_size=1)
+    result = pipeline.run([
+        [('RUN', [9000, 'n/a', 75])] + [('RUN', [9000, 1, 75])] * 50,
+        ['RUN 9000 0 75'],
+    ])
+    assert result['processed'] == 50
+    assert sorted(
+        (number, index) for number, index, _ in result['errors']
+    ) == [(0, 0), (1, 0)], (
+        'Нечисловое значение и нулевая длительность - ошибки пакета.'
+    )
+
+
+def test_package_pipeline_compute_error(monkeypatch):
+    def compute(chunk):
+        raise RuntimeError('bug')
+
+    pipeline = homework.PackagePipeline(chunk_size=1, queue_size=1)
+    monkeypatch.setattr(pipeline, 'compute', compute)
+    with pytest.raises(RuntimeError, match='bug'):
+        pipeline.run([[('RUN', [9000, 1, 75])] * 50])
+
+
+def test_validate_packages():
+    packages = [
+        ('RUN', [9000, 1, 75]),
+        ('XXX', [1, 2, 3]),
+        ('SWM', [720, 1, 80, 25]),
+        ('WLK', [9000, 1, '75', 180]),
+        ('WLK', [9000, 1.5, 75, 180]),
+    ]
+    rejects, errors = homework.validate_packages(packages)
+    assert list(rejects) == [1, 2, 3]
+    assert list(errors) == [
+        homework.ERR_TRAINING_TYPE,
+        homework.ERR_LEN_DATA_PACKAGE,
+        homework.ERR_DATA_TYPE,
+    ]
+    messages = homework.format_rejects(packages, rejects, errors)
+    for index in [1, 2]:
+        with pytest.raises(ValueError) as error:
+            homework.read_package(*packages[index])
+        assert messages[index - 1] == str(error.value), (
+            'Тексты ошибок пакетной проверки должны совпадать '
+            'с ошибками `read_package`.'
+        )
+    assert messages[2] == (
+        "Wrong package data. Non-numeric parameter for SportsWalking: '75'."
+    )
+
+
+# Допустимое время импорта homework.py (накопительное), микросекунды
+IMPORT_TIME_BUDGET = 150_000
+
+
+def test_import_time():
+    import subprocess
+    import sys
+    from conftest import BASE_DIR
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import sys, homework; print(*sys.modules, sep=chr(10))'],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    )
+    modules = set(result.stdout.splitlines())
+    for heavy in ['asyncio', 'concurrent.futures', 'json', 'mmap',
+                  'numpy', 'queue', 'threading']:
+        assert heavy not in modules, (
+            f'Импорт homework.py не должен загружать модуль {heavy}.'
+        )
+    cumulative = [
+        int(line.split('|')[1])
+        for line in result.stderr.splitlines()
+        if line.split('|')[-1].strip() == 'homework'
+    ][0]
+    assert cumulative < IMPORT_TIME_BUDGET, (
+        f'Импорт homework.py занял {cumulative} мкс, '
+        f'бюджет {IMPORT_TIME_BUDGET} мкс.'
+    )
+
+
+def test_cli(tmp_path, capsys):
+    path = tmp_path / 'packages.txt'
+    path.write_text('SWM 720 1 80 25 40\nRUN 1206 12 6\n')
+    assert homework.cli([str(path)]) == 0
+    assert capsys.readouterr().out.splitlines() == list(
+        homework.iter_lines([('SWM', [720, 1, 80, 25, 40]),
+                             ('RUN', [1206, 12, 6])])
+    )
+    binary = tmp_path / 'packages.bin'
+    binary.write_bytes(homework.encode_package('RUN', [1206, 12, 6]))
+    assert homework.cli(['--binary', '--format', 'csv', str(binary)]) == 0
+    assert capsys.readouterr().out.splitlines()[0] == homework.CSV_HEADER
+    assert homework.cli(['--workers', '2', str(path), str(path)]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 4
+    path.write_text('XXX 1 2 3\n')
+    assert homework.cli([str(path)]) == 1
+    assert 'Incorrect training code: XXX' in capsys.readouterr().err
+    path.write_text('RUN 15000 0 75\n')
+    for argv in [[str(path)], ['--workers', '2', str(path)]]:
+        assert homework.cli(argv) == 1, 'Нулевая длительность - ошибка пакета.'
+        assert 'division by zero' in capsys.readouterr().err
+
+
+def test_compact_classes_lazy():
+    assert homework.CompactRunning.__name__ == 'Running'
+    with pytest.raises(AttributeError):
+        homework.CompactUnknown
+
+
+@pytest.mark.parametrize('workout_type, input_data', [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [9000, 1, 75]),
+    ('WLK', [9000, 1, 75, 180]),
+])
+def test_get_calculator(workout_type, input_data):
+    workout_class = homework.TRAINING_CODES[workout_type][0]
+    expected = reference_metrics(workout_type, input_data)
+    assert homework.get_calculator(workout_class)(*input_data) == expected, (
+        'Скомпилированные формулы должны совпадать с исходными формулами.'
+    )
+    for metric, value in zip(homework.FORMULA_ORDER, expected):
+        assert homework.get_calculator(workout_class, metric)(
+            *input_data
+        ) == value
+
+
+def test_formulas_single_source(monkeypatch):
+    for workout_class in [homework.Swimming, homework.Running,
+                          homework.SportsWalking]:
+        assert not {
+            'get_distance', 'get_mean_speed', 'get_spent_calories'
+        } & set(vars(workout_class)), (
+            'Расчет встроенных тренировок задается только в FORMULAS.'
+        )
+    monkeypatch.setattr(homework, 'CALCULATORS', {})
+    monkeypatch.setattr(homework, 'TRAINING_CALCULATORS', {})
+    monkeypatch.setitem(homework.Running.__dict__['FORMULAS'],
+                        'calories', '0 * weight + 42.0')
+    training = homework.read_package('RUN', [9000, 1, 75])
+    assert training.get_spent_calories() == 42.0
+    assert training.show_training_info().calories == 42.0
+    assert list(homework.calculate_batch('RUN', {
+        'action': [9000], 'duration': [1], 'weight': [75]
+    })['calories']) == [42.0]
+
+
+def test_training_method_overrides(monkeypatch):
+    from dataclasses import dataclass
+
+    @dataclass
+    class Cycling(homework.Training):
+        def get_spent_calories(self):
+            return 42.0
+
+    assert Cycling(9000, 1, 75).show_training_info().calories == 42.0
+    training = homework.Running(9000, 1, 75)
+    monkeypatch.setattr(training, 'get_spent_calories', lambda: 100)
+    assert training.show_training_info().calories == 100, (
+        'show_training_info должен вызывать методы get_*.'
+    )
+
+
+@pytest.mark.parametrize('training', [
+    homework.Running(9000, 0, 75),
+    homework.SportsWalking(9000, 1, 75, 0),
+    homework.Swimming(9000, 0, 75, 25, 40),
+])
+def test_get_distance_own_formula(training):
+    assert training.get_distance() == 9000 * training.LEN_STEP / 1000, (
+        'get_distance не должен считать скорость и калории.'
+    )
+
+
+def test_declare_training(monkeypatch):
+    for table in ['TRAINING_CODES', 'COMPACT_TRAINING_CODES',
+                  'TRAINING_READERS', 'COMPACT_TRAINING_READERS']:
+        monkeypatch.setattr(homework, table, getattr(homework, table).copy())
+    rowing = homework.declare_training(
+        'ROW', 'Rowing', {'resistance': float},
+        {'calories': 'RESISTANCE_MULTIPLIER * resistance * weight * duration'},
+        {'LEN_STEP': 1.5, 'RESISTANCE_MULTIPLIER': 0.5},
+    )
+    assert issubclass(rowing, homework.Training)
+    training = homework.read_package('ROW', [1000, 2, 70, 4])
+    assert isinstance(training, rowing)
+    assert training.show_training_info() == homework.InfoMessage(
+        'Rowing', 2, 1.5, 0.75, 280.0
+    )
+    assert training.get_spent_calories() == 280.0
+    result = homework.calculate_batch('ROW', {
+        'action': [1000, 2000], 'duration': [2, 1],
+        'weight': [70, 80], 'resistance': [4, 1],
+    })
+    assert list(result['calories']) == [280.0, 40.0]
+
+
+def reference_metrics(workout_type, data):
+    """Дистанция, скорость и калории по исходным формулам методов
+    (независимо от FORMULAS), в том же порядке операций.
+    """
+    if workout_type == 'SWM':
+        action, duration, weight, length_pool, count_pool = data
+        distance = action * 1.38 / 1000
+        speed = length_pool * count_pool / 1000 / duration
+        return distance, speed, (speed + 1.1) * 2 * weight
+    action, duration, weight, *rest = data
+    distance = action * 0.65 / 1000
+    speed = distance / duration
+    if workout_type == 'RUN':
+        calories = (18 * speed - 20) * weight / 1000 * duration * 60
+    else:
+        calories = (
+            (0.035 * weight + (speed**2 // rest[0]) * 0.029 * weight)
+            * duration * 60
+        )
+    return distance, speed, calories
+
+
+def random_packages(count, seed=0):
+    import random
+    rng = random.Random(seed)
+    packages = []
+    for _ in range(count):
+        workout_type = rng.choice(['SWM', 'RUN', 'WLK'])
+        data = [rng.randint(100, 30000), round(rng.uniform(0.25, 3), 2),
+                round(rng.uniform(45, 120), 1)]
+        if workout_type == 'WLK':
+            data.append(round(rng.uniform(150, 200), 1))
+        elif workout_type == 'SWM':
+            data += [rng.choice([25, 50]), rng.randint(1, 80)]
+        packages.append((workout_type, data))
+    return packages
+
+
+def test_get_metrics_fused():
+    packages = random_packages(300)
+    for workout_type, data in packages:
+        training = homework.read_package(workout_type, data)
+        expected = reference_metrics(workout_type, data)
+        assert training.get_metrics() == expected, (
+            'Совмещенный расчет должен точно совпадать с исходными формулами.'
+        )
+        assert (
+            training.get_distance(),
+            training.get_mean_speed(),
+            training.get_spent_calories(),
+        ) == expected
+    assert list(homework.iter_messages(packages, fused=True)) == list(
+        homework.iter_messages(packages)
+    )
+
+
+@pytest.mark.parametrize('precision, tolerance', [
+    ('float64', 0),
+    ('float32', 1e-5),
+])
+def test_calculate_batch_precision(precision, tolerance):
+    packages = random_packages(300, seed=1)
+    for workout_type in ['SWM', 'RUN', 'WLK']:
+        rows = [data for code, data in packages if code == workout_type]
+        workout_class = homework.TRAINING_CODES[workout_type][0]
+        names = [field.name for field in homework.fields(workout_class)]
+        result = homework.calculate_batch(
+            workout_type, dict(zip(names, zip(*rows))), precision
+        )
+        for index, data in enumerate(rows):
+            expected = reference_metrics(workout_type, data)
+            for field, value in zip(['distance', 'speed', 'calories'],
+                                    expected):
+                assert result[field][index] == pytest.approx(
+                    value, rel=tolerance, abs=tolerance
+                ), f'{precision}: {workout_type} {data} {field}'
+    with pytest.raises(ValueError, match='Unknown precision: float16'):
+        homework.calculate_batch('RUN', {}, 'float16')
+
+
+@pytest.mark.parametrize('suffix', ['.txt', '.gz', '.bz2', '.xz'])
+def test_process_archive_resume(tmp_path, monkeypatch, suffix):
+    import bz2
+    import gzip
+    import lzma
+    openers = {'.txt': open, '.gz': gzip.open, '.bz2': bz2.open,
+               '.xz': lzma.open}
+    packages = [
+        f'{workout_type} {" ".join(map(str, data))}'
+        for workout_type, data in random_packages(200, seed=2)
+    ]
+    packages[5] = 'XXX 1 2 3'
+    archive = tmp_path / f'packages{suffix}'
+    with openers[suffix](archive, 'wt') as file:
+        file.write('\n'.join(packages) + '\n')
+    output = tmp_path / 'result.txt'
+
+    save_checkpoint = homework.save_checkpoint
+    calls = []
+
+    def interrupted_save(path, checkpoint):
+        calls.append(checkpoint['offset'])
+        if len(calls) == 3:
+            raise KeyboardInterrupt
+        save_checkpoint(path, checkpoint)
+
+    monkeypatch.setattr(homework, 'save_checkpoint', interrupted_save)
+    with pytest.raises(KeyboardInterrupt):
+        homework.process_archive(str(archive), str(output), chunk_size=500)
+    monkeypatch.setattr(homework, 'save_checkpoint', save_checkpoint)
+    result = homework.process_archive(
+        str(archive), str(output), chunk_size=500
+    )
+    assert result['packages'] == 199
+    assert result['errors'] == 1
+    assert output.read_text().splitlines() == list(
+        homework.iter_lines(packages[:5] + packages[6:])
+    ), 'Повторный запуск не должен терять или дублировать результаты.'
+
+
+def test_process_archive_bad_values(tmp_path):
+    archive = tmp_path / 'packages.txt'
+    archive.write_text('RUN 9000 1 75\nRUN 9000 0 75\nRUN 1 n/a 1\n')
+    output = tmp_path / 'result.txt'
+    result = homework.process_archive(str(archive), str(output))
+    assert result['packages'] == 1
+    assert result['errors'] == 2, (
+        'Нулевая длительность должна учитываться как ошибка пакета.'
+    )
+
+
+def test_result_index():
+    packages = random_packages(200, seed=3)
+    messages = list(homework.iter_messages(packages))
+    index = homework.ResultIndex(messages)
+    assert not index.insert(messages[0]), 'Дубликаты не должны добавляться.'
+    assert len(index) == len(set(
+        (info.training_type, info.duration, info.distance, info.speed,
+         info.calories) for info in messages
+    ))
+    swimming = [info for info in messages if info.training_type == 'Swimming']
+    found = index.range('Swimming', 'calories', low=300)
+    assert sorted(found, key=lambda info: info.calories) == found
+    assert {id(info) for info in found} == {
+        id(info) for info in swimming if info.calories >= 300
+    }
+    found = index.range('Running', 'speed', 5, 10)
+    assert found and all(5 <= info.speed <= 10 for info in found)
+    top = index.top('SportsWalking', 'distance', 3)
+    assert [info.distance for info in top] == sorted(
+        (info.distance for info in messages
+         if info.training_type == 'SportsWalking'), reverse=True
+    )[:3]
+    assert index.range('Rowing', 'speed') == []
+    assert index.top('Running', 'speed', 0) == []
+
+
+def test_run_cluster():
+    packages = random_packages(500, seed=4)
+    packages[10] = ('XXX', [1, 2, 3])
+    lines = list(homework.run_cluster(packages, workers=2, batch_size=37))
+    assert lines == [homework.format_package(package) for package in packages]
+    assert lines[10] == 'Error. Incorrect training code: XXX.'
+    packages = [('RUN', [9000, 1, 75])] * 5 + [('RUN', [9000, 0, 75])]
+    lines = list(homework.run_cluster(packages, workers=2, batch_size=3))
+    assert lines[-1].endswith('division by zero'), (
+        'Нулевая длительность не должна завершать рабочий процесс.'
+    )
+
+
+def test_run_cluster_close():
+    import itertools
+    import time
+    packages = itertools.cycle(random_packages(50, seed=6))
+    lines = homework.run_cluster(packages, workers=2, batch_size=10)
+    assert next(lines)
+    started = time.monotonic()
+    lines.close()
+    assert time.monotonic() - started < 5, (
+        'Закрытие генератора должно останавливать рабочих.'
+    )
+
+
+def test_coordinator_max_pending():
+    import itertools
+    import threading
+    coordinator = homework.Coordinator(
+        itertools.repeat(('RUN', [9000, 1, 75])), batch_size=1,
+        max_pending=3
+    )
+    taken = [coordinator.take()[0] for _ in range(3)]
+    for batch_id in taken:
+        coordinator.complete(batch_id, ['line'])
+    coordinator.POLL_TIMEOUT = 0.01
+    timer = threading.Timer(0.2, coordinator.close)
+    timer.start()
+    assert coordinator.take() == (None, None), (
+        'Координатор не должен опережать потребителя больше max_pending.'
+    )
+    assert coordinator.next_id == 3
+    timer.join()
+
+
+def test_coordinator_without_workers():
+    coordinator = homework.Coordinator([('RUN', [9000, 1, 75])])
+    with pytest.raises(RuntimeError, match='All workers exited'):
+        next(coordinator.iter_lines(lambda: False))
+
+
+def test_coordinator_retries_failed_batch():
+    import socket
+    import threading
+    import time
+    packages = random_packages(50, seed=5)
+    coordinator = homework.Coordinator(packages, batch_size=10)
+    host, port = coordinator.start()
+
+    with socket.create_connection((host, port)) as connection:
+        stream = connection.makefile('rwb')
+        stream.write(b'{}\n')
+        stream.flush()
+        assert json.loads(stream.readline())['batch_id'] == 0
+        stream.close()
+    for _ in range(100):
+        if coordinator.attempts:
+            break
+        time.sleep(0.05)
+    assert coordinator.attempts == {0: 1}
+
+    worker = threading.Thread(target=homework.run_worker, args=(host, port))
+    worker.start()
+    lines = list(coordinator.iter_lines())
+    worker.join()
+    coordinator.close()
+    assert lines == [homework.format_package(package) for package in packages]
+    assert coordinator.attempts == {0: 1}
+
+
+def test_calculate_package():
+    info = homework.read_package('RUN', [9000, 1, 75]).show_training_info()
+    for package in [('RUN', [9000, 1, 75]), 'RUN 9000 1 75',
+                    b'RUN 9000 1 75\n']:
+        assert homework.calculate_package(package) == (info, None)
+    for package in [('RUN', [9000, 'n/a', 75]), 'RUN 9000 0 75',
+                    b'\xff 1', 'XXX 1', ('RUN', [1])]:
+        info, error = homework.calculate_package(package)
+        assert info is None and error, f'{package!r} - ошибка пакета.'
+
+
+def test_format_package_errors():
+    assert homework.format_package('RUN 9000 1 75') == (
+        homework.read_package('RUN', [9000, 1, 75])
+        .show_training_info().get_message()
+    )
+    assert homework.format_package(('RUN', [9000, 1])).startswith(
+        'Wrong package data.'
+    )
+    assert 'unsupported operand' in homework.format_package(
+        ('RUN', [9000, 'n/a', 75])
+    )
+    assert homework.format_package('RUN 9000 0 75').endswith(
+        'division by zero'
+    )